@@ -1,17 +1,21 @@
+from .cache import warm_catalogs
 from .datacenter import get_datacenter
 from .distribution import get_distribution
 from .kernel import get_kernel
 from .plan import get_plan
-from .provision import provision
-from .linode import list_linodes, get_by_id
+from .provision import provision, provision_many
+from .linode import list_linodes, get_by_id, delete_linodes
 
 
 __all__ = [
     'list_linodes',
     'get_by_id',
+    'delete_linodes',
     'get_datacenter',
     'get_distribution',
     'get_kernel',
     'get_plan',
-    'provision'
+    'provision',
+    'provision_many',
+    'warm_catalogs'
 ]
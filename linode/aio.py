@@ -0,0 +1,673 @@
+"""
+asyncio flavoured versions of the blocking API helpers.
+
+A single event loop can drive a whole fleet of linodes::
+
+    from linode import aio
+
+    async def main(api_key):
+        nodes = await asyncio.gather(*[
+            aio.provision(api_key, 'secret', 'london', 'ubuntu')
+            for _ in range(10)
+        ])
+
+The HTTP transport is pluggable, see `set_transport`. Requires Python 3.5+.
+"""
+import asyncio
+import functools
+import itertools
+
+import requests
+
+from . import base, cache, errors, metrics, poller, ratelimit, retry, session
+from . import job as linode_job
+from . import linode as linode_linode
+from .provision import (
+    get_config_request, get_resource_calls, read_resources, resolve
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class ExecutorTransport(object):
+    """
+    Runs requests through the blocking keep-alive session pool in an
+    executor. Used when aiohttp is not installed.
+    """
+
+    def __init__(self, pool=None, executor=None):
+        self.pool = pool or session.default_pool
+        self.executor = executor
+
+    async def post(self, api_key, url, data):
+        loop = asyncio.get_event_loop()
+
+        try:
+            response = await loop.run_in_executor(
+                self.executor,
+                functools.partial(self.pool.post, api_key, url, data=data)
+            )
+        except requests.RequestException as exc:
+            raise errors.TransportError(str(exc))
+
+        return response.status_code, response.content
+
+    async def close(self):
+        pass
+
+
+class AiohttpTransport(object):
+    """
+    Native asyncio transport built on `aiohttp`. Connections are pooled and
+    kept alive across calls.
+    """
+
+    def __init__(self, limit=100, timeout=60):
+        self.limit = limit
+        self.timeout = timeout
+        self._session = None
+
+    def get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+
+        return self._session
+
+    async def post(self, api_key, url, data):
+        try:
+            async with self.get_session().post(url, data=data) as response:
+                return response.status, await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise errors.TransportError(str(exc))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+            self._session = None
+
+
+_transport = None
+
+
+def get_transport():
+    global _transport
+
+    if _transport is None:
+        if base.fake_api is not None:
+            from .fake import FakeTransport
+
+            _transport = FakeTransport(base.fake_api)
+        elif aiohttp is not None:
+            _transport = AiohttpTransport()
+        else:
+            _transport = ExecutorTransport()
+
+    return _transport
+
+
+def set_transport(transport):
+    """
+    Replace the transport used by every coroutine in this module. A
+    transport is any object with a coroutine method
+    `post(api_key, url, data)` returning `(status_code, content)`, where
+    `data` is the dict of form fields to send. Failures to get a response
+    should be raised as `linode.errors.TransportError`.
+    """
+    global _transport
+
+    _transport = transport
+
+
+async def make_linode_call(api_key, action, **kwargs):
+    wait = ratelimit.reserve(api_key, action, kwargs)
+
+    if wait:
+        await asyncio.sleep(wait)
+
+    params = base.encode_params(api_key, action, kwargs)
+
+    if not metrics.listeners:
+        return await send_with_retries(api_key, action, kwargs, params)
+
+    with metrics.timed(
+            'call',
+            action=action,
+            request_bytes=metrics.encoded_size(params),
+            batch_size=len(kwargs.get('api_requestArray') or [None])) as info:
+        return await send_with_retries(api_key, action, kwargs, params, info)
+
+
+async def send_with_retries(api_key, action, kwargs, params, info=None):
+    policy = retry.get_policy()
+    read_only = retry.is_read_only(action, kwargs)
+    attempts = policy.attempts if read_only else 1
+    delays = policy.delays()
+
+    for attempt in range(attempts):
+        try:
+            if read_only and policy.hedge_after is not None:
+                return await send_hedged(
+                    api_key,
+                    params,
+                    policy.hedge_after,
+                    info
+                )
+
+            return await send_request(api_key, params, info)
+        except errors.TransportError as exc:
+            if attempt + 1 >= attempts or not policy.is_retryable(exc):
+                raise
+
+        await asyncio.sleep(next(delays))
+
+
+async def send_request(api_key, params, info=None, hedged=False):
+    if info is not None:
+        metrics.add(info, 'hedges' if hedged else 'attempts')
+
+    status_code, content = await get_transport().post(
+        api_key,
+        base.API_URL,
+        params
+    )
+
+    if info is not None:
+        metrics.add(info, 'response_bytes', len(content))
+
+    return base.decode_response(status_code, content)
+
+
+async def send_hedged(api_key, params, hedge_after, info=None):
+    """
+    Send the request, and a second copy if the first has not answered
+    within `hedge_after` seconds. The first response wins.
+    """
+    tasks = [asyncio.ensure_future(send_request(api_key, params, info))]
+
+    done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+
+    if not done:
+        tasks.append(asyncio.ensure_future(
+            send_request(api_key, params, info, hedged=True)
+        ))
+
+    error = None
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                tasks.remove(task)
+
+                try:
+                    return task.result()
+                except errors.TransportError as exc:
+                    error = exc
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    raise error
+
+
+async def make_single_call(api_key, action, **kwargs):
+    if _coalescer is not None:
+        return await _coalescer.call(api_key, action, kwargs)
+
+    response = await make_linode_call(api_key, action, **kwargs)
+
+    return base.get_data(response)
+
+
+async def make_batch_call(api_key, *calls, chunk_size=None):
+    """
+    Unlike `base.make_batch_call` this returns a list, since the results
+    are only available once the request has been awaited. Chunks are sent
+    concurrently.
+    """
+    chunks = base.chunk(
+        base.get_batch_requests(calls),
+        chunk_size or base.batch_size
+    )
+
+    if not metrics.listeners:
+        return await send_batch(api_key, chunks)
+
+    with metrics.timed(
+            'batch',
+            action='batch',
+            batch_size=len(calls),
+            chunks=len(chunks)):
+        return await send_batch(api_key, chunks)
+
+
+async def send_batch(api_key, chunks):
+    responses = await asyncio.gather(*[
+        make_linode_call(api_key, 'batch', api_requestArray=sub_calls)
+        for sub_calls in chunks
+    ])
+
+    return list(base.iterate_results(
+        itertools.chain.from_iterable(responses)
+    ))
+
+
+class APIBatcher(base.APIBatcher):
+    async def execute(self):
+        return await make_batch_call(self.api_key, *self.calls)
+
+
+class Coalescer(object):
+    """
+    Coroutine version of `linode.coalesce.Coalescer`. The first call for an
+    api key schedules a flush `window` seconds later, which sends every call
+    queued in the meantime as a single batch.
+
+    Batches are sent from their own tasks, so a caller being cancelled does
+    not affect the others.
+    """
+
+    def __init__(self, window=0.005, max_size=25):
+        self.window = window
+        self.max_size = max_size
+
+        self.queues = {}
+        self.tasks = set()
+
+    async def call(self, api_key, action, kwargs):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        queue = self.queues.get(api_key)
+
+        if queue is None:
+            queue = self.queues[api_key] = []
+            loop.call_later(self.window, self.flush, api_key, queue)
+
+        queue.append((action, kwargs, future))
+
+        if len(queue) >= self.max_size:
+            self.flush(api_key, queue)
+
+        return await future
+
+    def flush(self, api_key, queue):
+        """
+        Start sending the calls of `queue`, unless that was done already.
+        Calls whose caller has been cancelled are left out.
+        """
+        if self.queues.get(api_key) is not queue:
+            return
+
+        del self.queues[api_key]
+
+        calls = [call for call in queue if not call[2].done()]
+
+        if not calls:
+            return
+
+        task = asyncio.ensure_future(self.send(api_key, calls))
+
+        # keep a reference until the task is done
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def send(self, api_key, calls):
+        if len(calls) == 1:
+            action, kwargs, future = calls[0]
+
+            try:
+                response = await make_linode_call(api_key, action, **kwargs)
+                result = base.get_data(response)
+            except Exception as exc:
+                result = exc
+
+            results = [result]
+        else:
+            try:
+                results = await make_batch_call(
+                    api_key,
+                    *[(action, dict(kwargs)) for action, kwargs, _ in calls]
+                )
+            except Exception as exc:
+                results = [exc] * len(calls)
+
+        for index, (_, _, future) in enumerate(calls):
+            if future.done():
+                continue
+
+            try:
+                result = results[index]
+            except IndexError:
+                result = RuntimeError('Missing result in batch response')
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_coalescer = None
+
+
+def enable_coalescing(window=0.005, max_size=25):
+    """
+    Merge single calls made by coroutines within `window` seconds into one
+    `batch` request. See `linode.coalesce` for the threaded equivalent.
+    """
+    global _coalescer
+
+    _coalescer = Coalescer(window, max_size)
+
+    return _coalescer
+
+
+def disable_coalescing():
+    global _coalescer
+
+    _coalescer = None
+
+
+async def get_jobs(api_key, linode_id, *jobs, **kwargs):
+    """
+    Coroutine version of `linode.job.get`.
+    """
+    job_ids = [linode_job.convert_to_job_id(job) for job in jobs]
+    multiple = kwargs.pop('multiple', False)
+
+    batcher = linode_job.get_batcher(
+        api_key,
+        linode_id,
+        job_ids,
+        kwargs.get('pending', None)
+    )
+
+    jobs = linode_job.from_results(
+        api_key,
+        await make_batch_call(api_key, *batcher.calls)
+    )
+
+    if len(jobs) == 1 and not multiple:
+        return jobs[0]
+
+    return jobs
+
+
+async def wait_jobs(api_key, linode_id, job_ids,
+                    return_when=asyncio.ALL_COMPLETED, action=None):
+    """
+    Coroutine version of `linode.job.wait_jobs`, waiting for the shared
+    poller without blocking the event loop.
+    """
+    futures = [
+        poller.watch(api_key, linode_id, job_id, action)
+        for job_id in job_ids
+    ]
+
+    try:
+        await asyncio.wait(
+            [asyncio.wrap_future(future) for future in futures],
+            return_when=return_when
+        )
+
+        return futures
+    finally:
+        for future in futures:
+            if not future.done():
+                poller.unwatch(future)
+
+
+async def waitall(api_key, linode_id, *jobs):
+    """
+    Waits for all jobs to be complete.
+    """
+    if not jobs:
+        return []
+
+    job_ids = [linode_job.convert_to_job_id(job) for job in jobs]
+
+    for future in await wait_jobs(api_key, linode_id, job_ids):
+        future.result()
+
+    return jobs
+
+
+async def waitany(api_key, linode_id, *jobs):
+    if not jobs:
+        return []
+
+    job_ids = [linode_job.convert_to_job_id(job) for job in jobs]
+    futures = await wait_jobs(
+        api_key,
+        linode_id,
+        job_ids,
+        asyncio.FIRST_COMPLETED
+    )
+
+    for future in futures:
+        if future.done():
+            return future.result()
+
+
+async def wait_job(job):
+    """
+    Coroutine version of `Job.wait`.
+    """
+    if job.finish:
+        return job
+
+    if not metrics.listeners:
+        return await _wait_job(job)
+
+    with metrics.timed(
+            'job.wait',
+            action=job.action,
+            linode_id=job.linode_id,
+            job_id=job.id):
+        return await _wait_job(job)
+
+
+async def _wait_job(job):
+    futures = await wait_jobs(
+        job.api_key,
+        job.linode_id,
+        [job.id],
+        action=job.action
+    )
+    finished_job = futures[0].result()
+
+    job.update_from(finished_job)
+
+    if not job.success:
+        raise linode_job.JobError(job)
+
+    return job
+
+
+async def load_catalogs(api_key):
+    """
+    Make sure every catalog needed by `provision` is in the cache, fetching
+    the missing ones in a single batch call.
+    """
+    missing = cache.get_missing(api_key)
+
+    if not missing:
+        return
+
+    batcher = cache.get_batcher(api_key, missing, APIBatcher)
+
+    cache.store_catalogs(api_key, missing, await batcher.execute())
+
+
+async def get_by_id(api_key, linode_id):
+    response = await make_single_call(
+        api_key,
+        'linode.list',
+        LinodeID=linode_id
+    )
+
+    try:
+        return linode_linode.Linode.from_json(api_key, response[0])
+    except IndexError:
+        return None
+
+
+async def delete_linode(api_key, linode_id, skip_checks=False):
+    await make_single_call(
+        api_key,
+        'linode.delete',
+        LinodeID=linode_id,
+        skipChecks=skip_checks
+    )
+
+
+async def boot_linode(api_key, linode_id, block=True):
+    """
+    Coroutine version of `linode.provision.boot_linode`, that also waits for
+    the boot with `block`.
+
+    :returns: The boot `Job`.
+    """
+    response = await make_single_call(
+        api_key,
+        'linode.boot',
+        LinodeID=linode_id
+    )
+
+    boot_job = linode_job.from_response(
+        api_key,
+        linode_id,
+        response,
+        'linode.boot'
+    )
+
+    if block:
+        await wait_job(boot_job)
+
+    return boot_job
+
+
+async def provision(api_key, root_password, datacenter, distribution,
+                    plan='1024', kernel=None, disk_size=None, swap=256,
+                    payment_term=1, private_ip=True, timeout=None):
+    """
+    Coroutine version of `linode.provision.provision`, see that function for
+    a description of the arguments.
+    """
+    try:
+        return await asyncio.wait_for(
+            _provision(
+                api_key,
+                root_password,
+                datacenter,
+                distribution,
+                plan,
+                kernel,
+                disk_size,
+                swap,
+                payment_term,
+                private_ip
+            ),
+            timeout
+        )
+    except asyncio.TimeoutError:
+        raise errors.DeadlineExceeded('Deadline exceeded')
+
+
+async def _provision(api_key, root_password, datacenter, distribution, plan,
+                     kernel, disk_size, swap, payment_term, private_ip):
+    """
+    Send the same requests as `linode.provision.build`.
+    """
+    await load_catalogs(api_key)
+
+    datacenter, plan, distribution, kernel = resolve(
+        api_key,
+        datacenter,
+        distribution,
+        plan,
+        kernel
+    )
+
+    if base.warm_pool is not None:
+        linode_instance = base.warm_pool.take(
+            api_key,
+            root_password,
+            datacenter,
+            plan,
+            distribution,
+            kernel,
+            disk_size,
+            swap,
+            payment_term,
+            private_ip
+        )
+
+        if linode_instance is not None:
+            try:
+                await boot_linode(api_key, linode_instance.id)
+            except:
+                await delete_linode(api_key, linode_instance.id, True)
+
+                raise
+
+            return linode_instance
+
+    response = await make_single_call(
+        api_key,
+        'linode.create',
+        DatacenterID=datacenter.id,
+        PlanID=plan.id,
+        PaymentTerm=payment_term
+    )
+    linode_id = response['LinodeID']
+
+    try:
+        calls = get_resource_calls(
+            linode_id,
+            plan,
+            distribution,
+            root_password,
+            disk_size,
+            swap,
+            private_ip
+        )
+        linode_instance, disk_jobs = read_resources(
+            api_key,
+            linode_id,
+            calls,
+            await make_batch_call(api_key, *calls)
+        )
+        linode_instance.plan = plan
+        linode_instance.datacenter = datacenter
+
+        await asyncio.gather(*[wait_job(disk_job) for disk_job in disk_jobs])
+
+        await make_single_call(
+            api_key,
+            'linode.config.create',
+            **get_config_request(
+                linode_id,
+                distribution,
+                kernel,
+                [disk_job.disk_id for disk_job in disk_jobs]
+            )
+        )
+
+        await boot_linode(api_key, linode_id)
+    except:
+        await delete_linode(api_key, linode_id, True)
+
+        raise
+
+    return linode_instance
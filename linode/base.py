@@ -1,8 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
+import functools
+import itertools
+import re
+import threading
+# `datetime.strptime` imports it on first use, which is not thread safe on
+# Python 2
+import _strptime  # noqa
 
 import requests
 
+from . import codec, compat, metrics, ratelimit, retry, session
+from .errors import APIError, TransportError
+
+
+API_URL = 'https://api.linode.com/'
+
+# most sub-calls sent in one batch request. Bigger batches are split into
+# chunks that are sent concurrently by `batch_workers` threads.
+batch_size = 25
+batch_workers = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# set by `linode.coalesce.enable` to merge concurrent single calls into batch
+# requests
+coalescer = None
+
+# set by `linode.listcache.enable` to reuse recent list responses
+response_cache = None
+
+# set by `linode.pool.enable` to hand out pre-built linodes from `provision`
+warm_pool = None
+
+# set by `linode.fake.install` so that the asyncio transport answers from the
+# fake API too
+fake_api = None
+
 
 class BaseObject(object):
     def __init__(self, api_key, id):
@@ -20,18 +55,27 @@ class BaseObject(object):
         return APIBatcher(self.api_key)
 
 
-def make_linode_call(api_key, action, **kwargs):
+def encode_params(api_key, action, kwargs):
     """
-    Makes a call to the linode api
-
-    Blocks until a result is returned.
+    Convert python keyword arguments into the parameters sent to the Linode
+    API. Anything that is not a string is JSON encoded.
     """
-    url = 'https://api.linode.com/'
     params = {}
+    dumps = codec.get_codec().dumps
 
     for name, value in kwargs.items():
-        if not isinstance(value, basestring):
-            value = json.dumps(value)
+        if isinstance(value, compat.string_types):
+            pass
+        elif value is True:
+            value = 'true'
+        elif value is False:
+            value = 'false'
+        elif value is None:
+            value = 'null'
+        elif isinstance(value, compat.integer_types):
+            value = str(value)
+        else:
+            value = dumps(value)
 
         params[name] = value
 
@@ -40,28 +84,101 @@ def make_linode_call(api_key, action, **kwargs):
         'api_key': api_key
     })
 
-    response = requests.post(url, params=params)
-
-    if response.status_code != 200:
-        raise RuntimeError
+    return params
 
-    data = response.content
 
-    return json.loads(data)
+def decode_response(status_code, content):
+    if status_code != 200:
+        raise TransportError(status_code=status_code)
 
+    return codec.loads(content)
 
-def make_single_call(api_key, action, **kwargs):
-    response = make_linode_call(api_key, action, **kwargs)
 
+def get_data(response):
+    """
+    Returns the DATA portion of a decoded API response, raising the first
+    error if there is one.
+    """
     errors = response['ERRORARRAY']
 
     if errors:
-        raise RuntimeError(errors[0])
+        raise APIError(errors[0])
 
     return response['DATA']
 
 
-def make_batch_call(api_key, *calls):
+def make_linode_call(api_key, action, **kwargs):
+    """
+    Makes a call to the linode api
+
+    Blocks until a result is returned. Requests go through the shared
+    keep-alive session pool, see `linode.session`, and wait for the client
+    side rate limits in `linode.ratelimit`. Read-only actions are retried
+    following `linode.retry`, and no request outlives the current deadline.
+    Reports a `call` event to `linode.metrics` listeners.
+    """
+    ratelimit.acquire(api_key, action, kwargs)
+
+    params = encode_params(api_key, action, kwargs)
+
+    if not metrics.listeners:
+        return retry.call(
+            action,
+            kwargs,
+            functools.partial(send_request, api_key, params)
+        )
+
+    with metrics.timed(
+            'call',
+            action=action,
+            request_bytes=metrics.encoded_size(params),
+            batch_size=len(kwargs.get('api_requestArray') or [None])) as info:
+        return retry.call(
+            action,
+            kwargs,
+            functools.partial(send_request, api_key, params, info=info)
+        )
+
+
+def send_request(api_key, params, time_left=None, info=None, hedged=False):
+    timeout = retry.bound_timeout(session.default_pool.timeout, time_left)
+
+    if info is not None:
+        metrics.add(info, 'hedges' if hedged else 'attempts')
+
+    try:
+        response = session.post(api_key, API_URL, data=params, timeout=timeout)
+    except requests.RequestException as exc:
+        raise TransportError(str(exc))
+
+    if info is not None:
+        metrics.add(info, 'response_bytes', len(response.content))
+
+    return decode_response(response.status_code, response.content)
+
+
+def make_single_call(api_key, action, **kwargs):
+    if response_cache is not None:
+        return response_cache.call(
+            api_key,
+            action,
+            kwargs,
+            functools.partial(send_single_call, api_key, action, kwargs)
+        )
+
+    return send_single_call(api_key, action, kwargs)
+
+
+def send_single_call(api_key, action, kwargs):
+    if coalescer is not None:
+        return coalescer.call(api_key, action, kwargs)
+
+    response = make_linode_call(api_key, action, **kwargs)
+
+    return get_data(response)
+
+
+def get_batch_requests(calls):
     sub_calls = []
 
     for action, kwargs in calls:
@@ -71,11 +188,90 @@ def make_batch_call(api_key, *calls):
 
         sub_calls.append(kwargs)
 
-    return iterate_results(make_linode_call(
+    return sub_calls
+
+
+def get_executor():
+    """
+    Returns the thread pool used to send batch chunks concurrently.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(batch_workers)
+
+    return _executor
+
+
+def chunk(items, size):
+    return [items[i:i + size] for i in compat.range(0, len(items), size)]
+
+
+def make_batch_call(api_key, *calls, **kwargs):
+    """
+    Send `calls` as `batch` requests, `chunk_size` (default `batch_size`)
+    sub-calls at a time. Chunks are sent concurrently and the results are
+    returned in the original order. Reports a `batch` event to
+    `linode.metrics` listeners.
+    """
+    if response_cache is not None:
+        response_cache.invalidate_calls(api_key, calls)
+
+    chunks = chunk(
+        get_batch_requests(calls),
+        kwargs.pop('chunk_size', None) or batch_size
+    )
+
+    try:
+        if not metrics.listeners:
+            return send_batch(api_key, chunks)
+
+        with metrics.timed(
+                'batch',
+                action='batch',
+                batch_size=len(calls),
+                chunks=len(chunks)):
+            return send_batch(api_key, chunks)
+    finally:
+        if response_cache is not None:
+            response_cache.invalidate_calls(api_key, calls)
+
+
+def send_batch(api_key, chunks):
+    if not chunks:
+        return iterate_results([])
+
+    futures = [
+        get_executor().submit(
+            call_with_deadline,
+            retry.get_deadline(),
+            make_linode_call,
+            api_key,
+            'batch',
+            api_requestArray=sub_calls
+        )
+        for sub_calls in chunks[1:]
+    ]
+
+    # the current thread sends the first chunk itself
+    responses = [make_linode_call(
         api_key,
         'batch',
-        api_requestArray=sub_calls
-    ))
+        api_requestArray=chunks[0]
+    )]
+
+    responses.extend(future.result() for future in futures)
+
+    return iterate_results(itertools.chain.from_iterable(responses))
+
+
+def call_with_deadline(when, func, *args, **kwargs):
+    """
+    Run `func` under the deadline of the thread that scheduled it.
+    """
+    with retry.deadline_at(when):
+        return func(*args, **kwargs)
 
 
 def iterate_results(batched_response):
@@ -84,7 +280,9 @@ def iterate_results(batched_response):
 
         if errors:
             # yes we're yielding an exception
-            yield Exception(errors[0])
+            yield APIError(errors[0])
+
+            continue
 
         yield response['DATA']
 
@@ -97,6 +295,117 @@ def filter(items, query):
     raise LookupError('{} not found'.format(query))
 
 
+# characters that make a label query a regular expression
+_REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+class Catalog(list):
+    """
+    List of catalog objects (plans, kernels ...) indexed for `find`.
+
+    `find` gives the same result as `filter`. The model class says how its
+    `__eq__` matches a string against a label: `label_attr` names the label
+    attribute and `label_match` is one of:
+
+    * `'prefix'` - the lowercased label starts with the query.
+    * `'suffix'` - the query is a regex matching the end of the label.
+    * `'search'` - the query is a regex found anywhere in the label.
+
+    Ids, prefixes and plain (not regex) suffixes are looked up in dicts.
+    Anything else scans the precomputed lowercased labels once and the
+    result is remembered.
+    """
+
+    # most remembered query results
+    max_queries = 1024
+
+    def __init__(self, items=()):
+        super(Catalog, self).__init__(items)
+
+        self.by_id = {}
+        self.labels = []
+        self.affixes = {}
+        self.queries = {}
+        self.label_match = None
+
+        if not self:
+            return
+
+        cls = type(self[0])
+        self.label_match = getattr(cls, 'label_match', None)
+        label_attr = getattr(cls, 'label_attr', 'label')
+
+        for obj in self:
+            self.by_id.setdefault(obj.id, obj)
+
+            if self.label_match is None:
+                continue
+
+            label = getattr(obj, label_attr).lower()
+            self.labels.append((label, obj))
+
+            if self.label_match == 'prefix':
+                affixes = (label[:end] for end in range(len(label) + 1))
+            elif self.label_match == 'suffix':
+                affixes = (label[start:] for start in range(len(label) + 1))
+            else:
+                continue
+
+            for affix in affixes:
+                self.affixes.setdefault(affix, obj)
+
+    def find(self, query):
+        """
+        Returns the first object equal to `query`.
+
+        :raises LookupError: Nothing matched.
+        """
+        if not isinstance(query, compat.string_types + compat.integer_types):
+            return filter(self, query)
+
+        if isinstance(query, compat.integer_types):
+            obj = self.by_id.get(query)
+        elif self.label_match is None:
+            return filter(self, query)
+        else:
+            obj = self.find_label(query.lower())
+
+        if obj is None:
+            raise LookupError('{} not found'.format(query))
+
+        return obj
+
+    def find_label(self, query):
+        if self.label_match == 'prefix':
+            return self.affixes.get(query)
+
+        plain = not _REGEX_CHARS.intersection(query)
+
+        if plain and self.label_match == 'suffix':
+            return self.affixes.get(query)
+
+        try:
+            return self.queries[query]
+        except KeyError:
+            pass
+
+        if plain:
+            matches = (obj for label, obj in self.labels if query in label)
+        else:
+            pattern = query + '$' if self.label_match == 'suffix' else query
+            search = re.compile(pattern).search
+            matches = (obj for label, obj in self.labels if search(label))
+
+        obj = next(matches, None)
+
+        if len(self.queries) >= self.max_queries:
+            self.queries.clear()
+
+        self.queries[query] = obj
+
+        return obj
+
+
 class APIBatcher(object):
     def __init__(self, api_key):
         self.api_key = api_key
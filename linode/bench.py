@@ -0,0 +1,245 @@
+"""
+Benchmarks run against the in-process fake API (see `linode.fake`).
+
+For each scenario and fleet size, reports the number of HTTP requests and
+API calls made, the bytes sent and received and the wall time::
+
+    python -m linode.bench --sizes 1,10,50 --latency 0.02
+
+Job durations from `linode.fake.JOB_DURATIONS` are multiplied by
+`--job-scale`, and jobs are polled every `--poll-interval` seconds, so the
+numbers measure the client rather than the (simulated) hosts.
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+from . import cache, compat, fake, job, linode, ratelimit
+from .provision import provision, provision_many
+
+
+def provision_scenario(api, size):
+    def run():
+        for _ in compat.range(size):
+            provision(fake.API_KEY, 'secret', 'london', 'ubuntu')
+
+    return run
+
+
+def provision_many_scenario(api, size):
+    def run():
+        provision_many(fake.API_KEY, size, 'secret', 'london', 'ubuntu')
+
+    return run
+
+
+def list_linodes_scenario(api, size):
+    api.seed(size)
+
+    def run():
+        linode.list_linodes(fake.API_KEY)
+
+    return run
+
+
+def list_related_scenario(api, size):
+    api.seed(size)
+
+    def run():
+        for node in linode.list_linodes(fake.API_KEY):
+            node.disks
+            node.get_ips()
+
+    return run
+
+
+def list_prefetch_scenario(api, size):
+    api.seed(size)
+
+    def run():
+        nodes = linode.list_linodes(fake.API_KEY, prefetch=['disks', 'ips'])
+
+        for node in nodes:
+            node.disks
+            node.get_ips()
+
+    return run
+
+
+def waitall_scenario(api, size):
+    linode_id = api.seed(1)[0]
+
+    with api.lock:
+        job_ids = [
+            api.add_job(linode_id, 'linode.boot')
+            for _ in compat.range(size)
+        ]
+
+    def run():
+        job.waitall(fake.API_KEY, linode_id, *job_ids)
+
+    return run
+
+
+def delete_linodes_scenario(api, size):
+    linode_ids = api.seed(size)
+
+    with api.lock:
+        for linode_id in linode_ids:
+            api.linodes[linode_id]['STATUS'] = 1
+
+    def run():
+        linode.delete_linodes(fake.API_KEY, linode_ids)
+
+    return run
+
+
+SCENARIOS = [
+    ('provision', provision_scenario),
+    ('provision_many', provision_many_scenario),
+    ('list_linodes', list_linodes_scenario),
+    ('list_linodes+disks+ips', list_related_scenario),
+    ('list_linodes+prefetch', list_prefetch_scenario),
+    ('job.waitall', waitall_scenario),
+    ('delete_linodes', delete_linodes_scenario),
+]
+
+
+def run_scenario(setup, size, latency=0, job_scale=0.1, poll_interval=0.05):
+    """
+    Run one scenario against a fresh fake API and an empty cache.
+
+    :returns: A dict of the measurements.
+    """
+    job_durations = dict(
+        (action, duration * job_scale)
+        for action, duration in fake.JOB_DURATIONS.items()
+    )
+
+    old_cache_dir = cache.cache_dir
+    old_poll_interval = job.POLL_INTERVAL
+
+    cache.cache_dir = tempfile.mkdtemp()
+    cache.memory.invalidate()
+    job.POLL_INTERVAL = poll_interval
+    job.reset_estimates()
+    ratelimit.reset()
+
+    api = fake.install(latency, job_durations)
+
+    try:
+        func = setup(api, size)
+
+        api.stats.reset()
+        start = time.time()
+
+        func()
+
+        wall = time.time() - start
+    finally:
+        fake.uninstall()
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+        cache.memory.invalidate()
+
+        cache.cache_dir = old_cache_dir
+        job.POLL_INTERVAL = old_poll_interval
+
+    return {
+        'size': size,
+        'requests': api.stats.requests,
+        'calls': api.stats.calls,
+        'sent': api.stats.bytes_in,
+        'received': api.stats.bytes_out,
+        'wall': wall,
+    }
+
+
+def run(scenarios=None, sizes=(1, 10, 50), **kwargs):
+    """
+    Yields a result dict per scenario and size.
+    """
+    for name, setup in SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+
+        for size in sizes:
+            result = run_scenario(setup, size, **kwargs)
+            result['scenario'] = name
+
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark lipy against a fake Linode API'
+    )
+    parser.add_argument(
+        '--sizes',
+        default='1,10,50',
+        help='comma separated fleet sizes (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--scenario',
+        action='append',
+        choices=[name for name, _ in SCENARIOS],
+        help='scenario to run, can be repeated (default: all)'
+    )
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help='seconds added to every HTTP request (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--job-scale',
+        type=float,
+        default=0.1,
+        help='multiplier for the fake job durations (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=0.05,
+        help='seconds between job polls (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='print one JSON object per result'
+    )
+
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.scenario,
+        [int(size) for size in args.sizes.split(',')],
+        latency=args.latency,
+        job_scale=args.job_scale,
+        poll_interval=args.poll_interval
+    )
+
+    if not args.json:
+        sys.stdout.write(
+            '{:<24} {:>6} {:>9} {:>8} {:>11} {:>11} {:>9}\n'.format(
+                'scenario', 'size', 'requests', 'calls', 'sent', 'received',
+                'wall'
+            )
+        )
+
+    for result in results:
+        if args.json:
+            sys.stdout.write(json.dumps(result, sort_keys=True) + '\n')
+        else:
+            sys.stdout.write(
+                '{scenario:<24} {size:>6} {requests:>9} {calls:>8} '
+                '{sent:>11} {received:>11} {wall:>9.3f}\n'.format(**result)
+            )
+
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
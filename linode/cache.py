@@ -1,10 +1,143 @@
+"""
+Cache for the `avail.*` catalogs.
+
+Catalogs are stored as JSON files under `cache_dir` and kept in memory for
+`memory_ttl` seconds, together with the model objects built from them, so a
+process parses each catalog once. Entries expire after `get_ttl(name)`
+seconds, after which they are still served while a background thread
+refreshes them. Files are replaced atomically and a
+missing catalog is fetched by one thread or process at a time (see
+`read_or_fill`), so several processes can share `cache_dir`::
+
+    from linode import cache
+
+    cache.memory_ttl = 600
+    cache.invalidate('kernels')
+    cache.warm_catalogs(api_key)
+"""
+import contextlib
 import os.path
 import errno
-import json
+import functools
+import hashlib
+import mmap
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from . import base, codec, compat, mmapcache
 
 
 cache_dir = os.path.abspath(os.path.expanduser('~/.lipy/cache'))
 
+# seconds a catalog is kept in memory, `None` to keep it until invalidated
+memory_ttl = 3600
+
+# seconds before a cached catalog is refreshed, by name. `None` never
+# expires.
+default_ttl = 24 * 3600
+ttls = {
+    'kernels': 6 * 3600,
+    'distributions': 6 * 3600,
+}
+
+# serve catalogs fetched with any api key to every api key. The avail.*
+# catalogs are the same for every account. When `False` an entry is only
+# served to the key that fetched it (one key per catalog is kept).
+shared = True
+
+# bumped when the layout of the cache files changes, older files are
+# ignored
+SCHEMA_VERSION = 1
+
+# `'json'`, or `'mmap'` to also write every catalog in the compact format of
+# `linode.mmapcache`, which `lookup` reads without parsing the whole file.
+# The JSON files are written either way and remain the fallback.
+backend = 'json'
+
+# the id and label fields indexed in the mapped files, by catalog name
+index_fields = {
+    'datacenters': ('DATACENTERID', 'LOCATION'),
+    'plans': ('PLANID', 'LABEL'),
+    'distributions': ('DISTRIBUTIONID', 'LABEL'),
+    'kernels': ('KERNELID', 'LABEL'),
+}
+
+MAPPED_SUFFIX = '.idx'
+
+
+class MemoryCache(object):
+    """
+    Process wide dict of values that expire `memory_ttl` seconds after they
+    were set.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        """
+        :raises KeyError: `key` is missing or has expired.
+        """
+        expires, value = self.entries[key]
+
+        if expires is not None and expires <= time.time():
+            with self.lock:
+                if self.entries.get(key, (None,))[0] == expires:
+                    del self.entries[key]
+
+            raise KeyError(key)
+
+        return value
+
+    def set(self, key, value):
+        expires = None
+
+        if memory_ttl is not None:
+            expires = time.time() + memory_ttl
+
+        with self.lock:
+            self.entries[key] = (expires, value)
+
+        return value
+
+    def invalidate(self, name=None):
+        """
+        Drop the entries for the catalog `name` (a key of `name` or
+        `(name, ...)`), or every entry.
+        """
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+
+                return
+
+            for key in list(self.entries):
+                if key == name or (isinstance(key, tuple) and key[0] == name):
+                    del self.entries[key]
+
+
+memory = MemoryCache()
+
+# raised by `read_from_cache` for a missing, unreadable or partial file
+READ_ERRORS = (IOError, OSError, ValueError)
+
+# atomic on POSIX, and on Windows where available (Python 3.3+)
+_replace = getattr(os, 'replace', os.rename)
+
+_locks = {}
+_locks_lock = threading.Lock()
+_refreshing = set()
+# memory key of the mapped catalogs
+_mapped_key = object()
+
 
 def get_cache_dir():
     global cache_dir
@@ -28,11 +161,424 @@ def get_cache_filename(file_name):
     )
 
 
-def write_to_cache(file_name, result):
-    with open(get_cache_filename(file_name), 'wb') as fp:
-        fp.write(json.dumps(result))
+def get_scope(api_key):
+    """
+    Returns an id for `api_key` that is safe to store in the cache files.
+    """
+    if api_key is None:
+        return None
+
+    return hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_ttl(name):
+    return ttls.get(name, default_ttl)
+
+
+def is_expired(entry, now=None):
+    ttl = get_ttl(entry['name'])
+
+    if ttl is None:
+        return False
+
+    return entry['fetched_at'] + ttl <= (now or time.time())
+
+
+def write_to_cache(file_name, result, api_key=None):
+    """
+    Write `result` with its metadata to a temporary file and rename it over
+    the cache file, so readers (in this or any other process) see the old
+    or the new content but never a partial file.
+    """
+    entry = {
+        'name': file_name,
+        'version': SCHEMA_VERSION,
+        'fetched_at': time.time(),
+        'scope': get_scope(api_key),
+        'data': result,
+    }
+
+    write_file(file_name, codec.dumps_bytes(entry))
+
+    if backend == 'mmap' and file_name in index_fields:
+        id_field, label_field = index_fields[file_name]
+
+        write_file(file_name + MAPPED_SUFFIX, mmapcache.dumps(
+            entry,
+            id_field,
+            label_field,
+            SCHEMA_VERSION
+        ))
+
+    memory.invalidate(file_name)
+    memory.set(file_name, entry)
+
+
+def write_file(file_name, content):
+    path = get_cache_filename(file_name)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path),
+        prefix='.' + file_name + '.'
+    )
+
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(content)
+
+        _replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+
+        raise
+
+
+def read_entry(name, api_key=None):
+    """
+    Returns the cache entry `name`: a dict of the `data` and its metadata
+    (`fetched_at`, `version` and `scope`). Expired entries are returned too.
+
+    :raises IOError, OSError: The file is missing or unreadable.
+    :raises ValueError: The file is not valid JSON, was written with
+        another `SCHEMA_VERSION` or (unless `shared`) for another api key.
+    """
+    try:
+        entry = memory.get(name)
+    except KeyError:
+        with open(get_cache_filename(name), 'rb') as fp:
+            entry = codec.loads(fp.read())
+
+        if not isinstance(entry, dict) or \
+                entry.get('version') != SCHEMA_VERSION:
+            raise ValueError('{} cache has an old format'.format(name))
+
+        memory.set(name, entry)
+
+    if not shared and api_key is not None and \
+            entry['scope'] != get_scope(api_key):
+        raise ValueError('{} cache is for another api key'.format(name))
+
+    return entry
+
+
+def read_from_cache(name, api_key=None):
+    """
+    Returns the cached data of `name`, even if it has expired.
+
+    :raises: See `read_entry`.
+    """
+    return read_entry(name, api_key)['data']
+
+
+def get_lock(name):
+    with _locks_lock:
+        try:
+            return _locks[name]
+        except KeyError:
+            lock = _locks[name] = threading.Lock()
+
+            return lock
+
+
+@contextlib.contextmanager
+def locked(name):
+    """
+    Hold the lock of the cache file `name`, against the other threads of
+    this process and (where `fcntl` is available) other processes sharing
+    `cache_dir`.
+    """
+    with get_lock(name):
+        with open(get_cache_filename(name + '.lock'), 'a') as fp:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+
+            # closing the file releases the flock
+            yield
+
+
+def read_or_fill(name, fetch, api_key=None):
+    """
+    Returns the cached `name`. If it is missing (or unreadable) `fetch()` is
+    called and its result cached. Only one thread or process fetches at a
+    time, the others wait for the lock and then read what it wrote.
+
+    An expired entry is returned as is while `fetch` runs in a background
+    thread to refresh it.
+    """
+    try:
+        entry = read_entry(name, api_key)
+    except READ_ERRORS:
+        pass
+    else:
+        if is_expired(entry):
+            refresh(name, fetch, api_key)
+
+        return entry['data']
+
+    with locked(name):
+        try:
+            return read_from_cache(name, api_key)
+        except READ_ERRORS:
+            pass
+
+        result = fetch()
+        write_to_cache(name, result, api_key)
+
+        return result
+
+
+def refresh(name, fetch, api_key=None):
+    """
+    Refill the expired entry `name` in a background thread, unless this
+    process is already doing so.
+    """
+    with _locks_lock:
+        if name in _refreshing:
+            return
+
+        _refreshing.add(name)
+
+    thread = threading.Thread(
+        target=_refresh,
+        args=(name, fetch, api_key),
+        name='lipy-cache-refresh-' + name
+    )
+    thread.daemon = True
+    thread.start()
+
+
+def _refresh(name, fetch, api_key):
+    try:
+        with locked(name):
+            # another process may have refreshed it while we waited
+            try:
+                if not is_expired(read_entry(name, api_key)):
+                    return
+            except READ_ERRORS:
+                pass
+
+            write_to_cache(name, fetch(), api_key)
+    except Exception:
+        # keep serving the stale entry, the next lookup tries again
+        pass
+    finally:
+        with _locks_lock:
+            _refreshing.discard(name)
+
+
+def invalidate(name=None):
+    """
+    Forget the catalog `name` (or every catalog), in memory and on disk, so
+    it is fetched from the API on next use.
+    """
+    names = [name] if name else [key for key, _ in catalogs]
+
+    memory.invalidate(name)
+
+    for file_name in names:
+        for suffix in ('', MAPPED_SUFFIX):
+            try:
+                os.remove(os.path.join(cache_dir, file_name + suffix))
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+
+
+# cache names and the API actions returning them
+catalogs = [
+    ('datacenters', 'avail.datacenters'),
+    ('plans', 'avail.linodeplans'),
+    ('distributions', 'avail.distributions'),
+    ('kernels', 'avail.kernels'),
+]
+
+
+def get_missing(api_key, names=None):
+    """
+    Returns the names of the catalogs (of `names`, default all) that are not
+    cached.
+    """
+    missing = []
+
+    for name, _ in catalogs:
+        if names is not None and name not in names:
+            continue
+
+        try:
+            read_entry(name, api_key)
+        except READ_ERRORS:
+            missing.append(name)
+
+    return missing
+
+
+def get_batcher(api_key, names, cls=None):
+    """
+    Returns an `APIBatcher` (`cls`, default `base.APIBatcher`) fetching the
+    catalogs `names`.
+    """
+    actions = dict(catalogs)
+    batcher = (cls or base.APIBatcher)(api_key)
+
+    for name in names:
+        batcher.add(actions[name])
+
+    return batcher
+
+
+def store_catalogs(api_key, names, results):
+    """
+    Cache the `results` of a batch made by `get_batcher(api_key, names)`.
+    The catalogs fetched are stored even if others failed, the first error
+    is raised afterwards.
+    """
+    error = None
+
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            error = error or result
+
+            continue
+
+        write_to_cache(name, result, api_key)
+
+    if error is not None:
+        raise error
+
+
+@contextlib.contextmanager
+def locked_all(names):
+    """
+    `locked` for several names, always taken in the same order.
+    """
+    names = sorted(names)
+
+    if not names:
+        yield
+
+        return
+
+    with locked(names[0]):
+        with locked_all(names[1:]):
+            yield
+
+
+def warm_catalogs(api_key, names=None):
+    """
+    Fetch every missing catalog (of `names`, default all) in a single batch
+    request, so a cold start costs one round trip instead of one per
+    catalog.
+
+    :returns: The names of the catalogs fetched.
+    """
+    missing = get_missing(api_key, names)
+
+    if not missing:
+        return []
+
+    with locked_all(missing):
+        # another thread or process may have filled some while we waited
+        missing = get_missing(api_key, missing)
+
+        if missing:
+            batcher = get_batcher(api_key, missing)
+
+            store_catalogs(api_key, missing, batcher.execute())
+
+    return missing
+
+
+def load_catalog(api_key, name, from_json):
+    """
+    Returns the catalog `name` as a `base.Catalog` of model objects built
+    with `from_json`, fetching it from the API if it is not cached. The
+    catalog is shared between callers and must not be modified.
+    """
+    fetch = functools.partial(
+        base.make_single_call,
+        api_key,
+        dict(catalogs)[name]
+    )
+
+    if get_missing(api_key, [name]):
+        # cold start, fetch the other catalogs in the same request
+        warm_catalogs(api_key)
+
+    result = read_or_fill(name, fetch, api_key)
+
+    try:
+        cached, catalog = memory.get((name, api_key))
+    except KeyError:
+        cached = None
+
+    # rebuild the objects when the entry was refreshed
+    if cached is not result:
+        catalog = base.Catalog(from_json(api_key, data) for data in result)
+
+        memory.set((name, api_key), (result, catalog))
+
+    return catalog
+
+
+def get_mapped(name, api_key=None):
+    """
+    Returns the `mmapcache.MappedCatalog` of `name` if it is usable (it
+    exists, has not expired and, unless `shared`, was fetched with
+    `api_key`), or `None`.
+    """
+    try:
+        mapped = memory.get((name, _mapped_key))
+    except KeyError:
+        try:
+            mapped = mmapcache.MappedCatalog(
+                get_cache_filename(name + MAPPED_SUFFIX)
+            )
+        except READ_ERRORS + (mmap.error, struct.error):
+            return None
+
+        memory.set((name, _mapped_key), mapped)
+
+    if mapped.schema_version != SCHEMA_VERSION:
+        return None
+
+    if not shared and mapped.scope != get_scope(api_key):
+        return None
+
+    ttl = get_ttl(name)
+
+    if ttl is not None and mapped.fetched_at + ttl <= time.time():
+        return None
+
+    return mapped
+
+
+def lookup(api_key, name, cls, query):
+    """
+    Returns the object of the catalog `name` (of model class `cls`) equal to
+    `query`, like `load_catalog(...).find(query)`.
+
+    With the `'mmap'` backend the lookup is answered from the mapped file
+    when possible, decoding only the record found. Otherwise (and while
+    the mapped file is missing or expired) the JSON catalog is loaded.
+
+    :raises LookupError: Nothing matched.
+    """
+    mapped = None
+
+    if backend == 'mmap' and not isinstance(query, bool):
+        if isinstance(query, compat.integer_types) or (
+                isinstance(query, compat.string_types) and
+                getattr(cls, 'label_match', None)):
+            mapped = get_mapped(name, api_key)
+
+    if mapped is None:
+        return load_catalog(api_key, name, cls.from_json).find(query)
+
+    if isinstance(query, compat.string_types):
+        index = mapped.find_label(query.lower(), cls.label_match)
+    else:
+        index = mapped.find_id(query)
 
+    if index is None:
+        raise LookupError('{} not found'.format(query))
 
-def read_from_cache(name):
-    with open(get_cache_filename(name), 'rb') as fp:
-        return json.loads(fp.read())
+    return cls.from_json(api_key, mapped.get_record(index))
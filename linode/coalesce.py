@@ -0,0 +1,136 @@
+"""
+Opt-in micro-batching of single API calls.
+
+When enabled, calls to `base.make_single_call` made within a short window
+(from any thread) are merged into one `batch` request. Each caller still gets
+its own result, or has its own error raised::
+
+    from linode import coalesce
+
+    coalesce.enable(window=0.005)
+"""
+import threading
+import time
+
+from . import base
+
+
+class PendingCall(object):
+    def __init__(self, action, kwargs):
+        self.action = action
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.event = threading.Event()
+
+    def set_result(self, result):
+        if isinstance(result, Exception):
+            self.error = result
+        else:
+            self.result = result
+
+        self.event.set()
+
+    def get(self):
+        self.event.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class Coalescer(object):
+    """
+    Merges single calls into batch requests.
+
+    The first caller to arrive for an api key becomes the leader: it waits
+    `window` seconds for other calls to queue up and then sends the whole
+    queue as a batch, handing each caller its result. A queue that reaches
+    `max_size` calls is sent straight away by the caller that filled it.
+
+    :param window: Seconds to wait for other calls before sending.
+    :param max_size: Most calls to merge into a single batch.
+    """
+
+    def __init__(self, window=0.005, max_size=25):
+        self.window = window
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def call(self, api_key, action, kwargs):
+        call = PendingCall(action, kwargs)
+        to_send = None
+
+        with self.lock:
+            queue = self.queues.get(api_key)
+            leader = queue is None
+
+            if leader:
+                queue = self.queues[api_key] = []
+
+            queue.append(call)
+
+            if len(queue) >= self.max_size:
+                to_send = self.queues.pop(api_key)
+
+        if to_send:
+            self.send(api_key, to_send)
+        elif leader:
+            time.sleep(self.window)
+
+            with self.lock:
+                # the queue may have already been sent because it filled up
+                if self.queues.get(api_key) is queue:
+                    to_send = self.queues.pop(api_key)
+
+            if to_send:
+                self.send(api_key, to_send)
+
+        return call.get()
+
+    def send(self, api_key, calls):
+        if len(calls) == 1:
+            call = calls[0]
+
+            try:
+                response = base.make_linode_call(
+                    api_key,
+                    call.action,
+                    **call.kwargs
+                )
+
+                call.set_result(base.get_data(response))
+            except Exception as exc:
+                call.set_result(exc)
+
+            return
+
+        try:
+            results = list(base.make_batch_call(
+                api_key,
+                *[(call.action, dict(call.kwargs)) for call in calls]
+            ))
+        except Exception as exc:
+            results = [exc] * len(calls)
+
+        for call, result in zip(calls, results):
+            call.set_result(result)
+
+        for call in calls[len(results):]:
+            call.set_result(RuntimeError('Missing result in batch response'))
+
+
+def enable(window=0.005, max_size=25):
+    """
+    Start coalescing single calls made through `base.make_single_call`.
+    """
+    base.coalescer = Coalescer(window, max_size)
+
+    return base.coalescer
+
+
+def disable():
+    base.coalescer = None
@@ -0,0 +1,148 @@
+"""
+Pluggable JSON codec used to encode requests, decode responses and read and
+write the cache.
+
+The fastest installed of `orjson`, `ujson` and `simplejson` is picked,
+falling back to the standard library `json` module. Use `set_codec` to
+choose one explicitly::
+
+    from linode import codec
+
+    codec.set_codec('json')
+"""
+import json
+
+from . import compat
+
+
+class Codec(object):
+    """
+    Wraps a JSON implementation.
+
+    `loads` accepts the raw response bytes directly and `dumps` returns
+    text.
+    """
+
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def dumps_bytes(self, obj):
+        return self.dumps(obj).encode('utf-8')
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, self.name)
+
+
+class JSONCodec(Codec):
+    def __init__(self):
+        # stdlib json on Python < 3.6 only accepts text
+        try:
+            json.loads(b'{}')
+        except TypeError:
+            self.loads = self.loads_text
+
+    def loads_text(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+
+        self.loads = orjson.loads
+        self.dumps_bytes = orjson.dumps
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+
+class UjsonCodec(Codec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+
+        self.loads = ujson.loads
+        self.dumps = ujson.dumps
+
+
+class SimplejsonCodec(Codec):
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+
+        self.loads = simplejson.loads
+        self.dumps = simplejson.dumps
+
+
+codecs = [
+    ('orjson', OrjsonCodec),
+    ('ujson', UjsonCodec),
+    ('simplejson', SimplejsonCodec),
+    ('json', JSONCodec),
+]
+
+
+def find_codec(name=None):
+    """
+    Returns the codec called `name`, or the fastest one installed.
+    """
+    for codec_name, cls in codecs:
+        if name and name != codec_name:
+            continue
+
+        try:
+            return cls()
+        except ImportError:
+            if name:
+                raise
+
+    raise LookupError('{} codec not found'.format(name))
+
+
+_codec = None
+
+
+def get_codec():
+    global _codec
+
+    if _codec is None:
+        _codec = find_codec()
+
+    return _codec
+
+
+def set_codec(codec):
+    """
+    :param codec: A codec name (`'orjson'`, `'ujson'`, `'simplejson'` or
+        `'json'`), a `Codec` instance or `None` to pick the fastest again.
+    """
+    global _codec
+
+    if codec is None or isinstance(codec, compat.string_types):
+        codec = find_codec(codec)
+
+    _codec = codec
+
+
+def loads(data):
+    return get_codec().loads(data)
+
+
+def dumps(obj):
+    return get_codec().dumps(obj)
+
+
+def dumps_bytes(obj):
+    return get_codec().dumps_bytes(obj)
@@ -0,0 +1,16 @@
+"""
+Python 2/3 compatibility names.
+"""
+import sys
+
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    string_types = (basestring,)  # noqa
+    integer_types = (int, long)  # noqa
+    range = xrange  # noqa
+else:
+    string_types = (str,)
+    integer_types = (int,)
+    range = range
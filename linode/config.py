@@ -1,4 +1,4 @@
-from . import base
+from . import base, compat
 
 
 _missing = object()
@@ -60,7 +60,7 @@ class Config(base.BaseObject):
 
 
 def get_disk_list(value):
-    if isinstance(value, basestring):
+    if isinstance(value, compat.string_types):
         return value
 
     if not isinstance(value, list):
@@ -69,14 +69,14 @@ def get_disk_list(value):
     ret = []
 
     for disk in value:
-        if isinstance(disk, (basestring, int)):
+        if isinstance(disk, compat.string_types + compat.integer_types):
             ret.append(str(disk))
 
             continue
 
         ret.append(str(disk.id))
 
-    for _ in xrange(9 - len(ret)):
+    for _ in compat.range(9 - len(ret)):
         ret.append('')
 
     return ','.join(ret)
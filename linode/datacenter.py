@@ -1,7 +1,10 @@
-from . import base, cache
+from . import base, cache, compat
 
 
 class Datacenter(base.BaseObject):
+    label_attr = 'location'
+    label_match = 'prefix'
+
     def __init__(self, api_key, id, location):
         super(Datacenter, self).__init__(api_key, id)
 
@@ -19,10 +22,10 @@ class Datacenter(base.BaseObject):
         return self.location
 
     def __eq__(self, value):
-        if isinstance(value, basestring):
+        if isinstance(value, compat.string_types):
             return self.location.lower().startswith(value.lower())
 
-        if isinstance(value, (int, long)):
+        if isinstance(value, compat.integer_types):
             return value == self.id
 
         return False
@@ -37,18 +40,8 @@ class Datacenter(base.BaseObject):
 
 
 def load_datacenters(api_key):
-    try:
-        result = cache.read_from_cache('datacenters')
-    except:
-        result = base.make_single_call(
-            api_key,
-            'avail.datacenters'
-        )
-
-        cache.write_to_cache('datacenters', result)
-
-    return [Datacenter.from_json(api_key, data) for data in result]
+    return cache.load_catalog(api_key, 'datacenters', Datacenter.from_json)
 
 
 def get_datacenter(api_key, location):
-    return base.filter(load_datacenters(api_key), location)
+    return cache.lookup(api_key, 'datacenters', Datacenter, location)
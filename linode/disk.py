@@ -73,13 +73,13 @@ def get_by_linode(api_key, linode_id):
     """
     Returns the Disk objects associated with a given Linode
     """
-    response = base.make_linode_call(
+    response = base.make_single_call(
         api_key,
         'linode.disk.list',
         LinodeID=linode_id
     )
 
-    for data in response['DATA']:
+    for data in response:
         yield Disk.from_json(api_key, data)
 
 
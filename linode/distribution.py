@@ -1,9 +1,12 @@
 import re
 
-from . import base, cache
+from . import base, cache, compat
 
 
 class Distribution(base.BaseObject):
+    label_attr = 'label'
+    label_match = 'search'
+
     def __init__(self, api_key, id, label, x64, min_size, vops_kernel):
         super(Distribution, self).__init__(api_key, id)
 
@@ -27,10 +30,10 @@ class Distribution(base.BaseObject):
         return self.label
 
     def __eq__(self, value):
-        if isinstance(value, basestring):
+        if isinstance(value, compat.string_types):
             return bool(re.search(value.lower(), self.label.lower()))
 
-        if isinstance(value, (int, long)):
+        if isinstance(value, compat.integer_types):
             return value == self.id
 
         return False
@@ -45,19 +48,8 @@ class Distribution(base.BaseObject):
 
 
 def load_distributions(api_key):
-    try:
-        result = cache.read_from_cache('distributions')
-    except:
-        result = base.make_single_call(
-            api_key,
-            'avail.distributions'
-        )
-
-        cache.write_to_cache('distributions', result)
-
-    for data in result:
-        yield Distribution.from_json(api_key, data)
+    return cache.load_catalog(api_key, 'distributions', Distribution.from_json)
 
 
 def get_distribution(api_key, label):
-    return base.filter(load_distributions(api_key), label)
+    return cache.lookup(api_key, 'distributions', Distribution, label)
@@ -0,0 +1,23 @@
+class APIError(RuntimeError):
+    """
+    An error returned by the Linode API in the ERRORARRAY of a response.
+    """
+
+
+class TransportError(RuntimeError):
+    """
+    The request did not get a usable response from the Linode API, e.g. a
+    connection failure, timeout or non-200 status code.
+    """
+
+    def __init__(self, message=None, status_code=None):
+        super(TransportError, self).__init__(message or status_code)
+
+        self.status_code = status_code
+
+
+class DeadlineExceeded(TransportError):
+    """
+    The deadline set with `linode.retry.deadline` passed before the
+    operation completed.
+    """
@@ -0,0 +1,783 @@
+"""
+An in-process fake of the Linode v3 API, for tests and benchmarks.
+
+The fake keeps its state in memory and implements the actions used by this
+package. Jobs finish `job_durations[action]` seconds after they are created.
+Point the library at it with `install`::
+
+    from linode import fake
+
+    api = fake.install(latency=0.01)
+    linode.provision(fake.API_KEY, 'secret', 'london', 'ubuntu')
+    print(api.stats)
+"""
+from datetime import datetime
+import itertools
+import json
+import threading
+import time
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+try:
+    from urllib.parse import parse_qsl
+except ImportError:
+    from urlparse import parse_qsl
+
+from . import base, compat, session
+
+
+API_KEY = 'fake-api-key'
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+DATACENTERS = [
+    {'DATACENTERID': 2, 'LOCATION': 'Dallas, TX, USA', 'ABBR': 'dallas'},
+    {'DATACENTERID': 3, 'LOCATION': 'Fremont, CA, USA', 'ABBR': 'fremont'},
+    {'DATACENTERID': 4, 'LOCATION': 'Atlanta, GA, USA', 'ABBR': 'atlanta'},
+    {'DATACENTERID': 6, 'LOCATION': 'Newark, NJ, USA', 'ABBR': 'newark'},
+    {'DATACENTERID': 7, 'LOCATION': 'London, England, UK', 'ABBR': 'london'},
+    {'DATACENTERID': 8, 'LOCATION': 'Tokyo, JP', 'ABBR': 'tokyo'},
+]
+
+PLANS = [
+    {'PLANID': 1, 'LABEL': 'Linode 1024', 'RAM': 1024, 'DISK': 24,
+     'XFER': 2000, 'PRICE': 10.0, 'CORES': 1},
+    {'PLANID': 2, 'LABEL': 'Linode 2048', 'RAM': 2048, 'DISK': 48,
+     'XFER': 3000, 'PRICE': 20.0, 'CORES': 2},
+    {'PLANID': 4, 'LABEL': 'Linode 4096', 'RAM': 4096, 'DISK': 96,
+     'XFER': 4000, 'PRICE': 40.0, 'CORES': 4},
+    {'PLANID': 6, 'LABEL': 'Linode 8192', 'RAM': 8192, 'DISK': 192,
+     'XFER': 8000, 'PRICE': 80.0, 'CORES': 6},
+]
+
+DISTRIBUTIONS = [
+    {'DISTRIBUTIONID': 124, 'LABEL': 'Ubuntu 14.04 LTS', 'IS64BIT': 1,
+     'MINIMAGESIZE': 750, 'REQUIRESPVOPSKERNEL': 1},
+    {'DISTRIBUTIONID': 126, 'LABEL': 'Ubuntu 12.04 LTS', 'IS64BIT': 1,
+     'MINIMAGESIZE': 600, 'REQUIRESPVOPSKERNEL': 1},
+    {'DISTRIBUTIONID': 130, 'LABEL': 'Debian 7', 'IS64BIT': 1,
+     'MINIMAGESIZE': 600, 'REQUIRESPVOPSKERNEL': 1},
+    {'DISTRIBUTIONID': 129, 'LABEL': 'CentOS 7', 'IS64BIT': 1,
+     'MINIMAGESIZE': 750, 'REQUIRESPVOPSKERNEL': 1},
+    {'DISTRIBUTIONID': 127, 'LABEL': 'CentOS 6.5 32bit', 'IS64BIT': 0,
+     'MINIMAGESIZE': 675, 'REQUIRESPVOPSKERNEL': 1},
+]
+
+KERNELS = [
+    {'KERNELID': 138, 'LABEL': 'Latest 64 bit (3.15.4-x86_64-linode45)',
+     'ISXEN': 1, 'ISPVOPS': 1},
+    {'KERNELID': 137, 'LABEL': 'Latest 32 bit (3.15.4-x86-linode64)',
+     'ISXEN': 1, 'ISPVOPS': 1},
+    {'KERNELID': 110, 'LABEL': 'pv-grub-x86_64', 'ISXEN': 1, 'ISPVOPS': 0},
+    {'KERNELID': 95, 'LABEL': 'pv-grub-x86_32', 'ISXEN': 1, 'ISPVOPS': 0},
+] + [
+    {'KERNELID': 200 + index,
+     'LABEL': '3.{}.{}-x86_64-linode{}'.format(index // 10, index % 10,
+                                               index),
+     'ISXEN': 1, 'ISPVOPS': 1}
+    for index in compat.range(200)
+]
+
+# seconds each kind of job takes to finish
+JOB_DURATIONS = {
+    'linode.boot': 0.5,
+    'linode.reboot': 0.5,
+    'linode.shutdown': 0.3,
+    'linode.create': 0.0,
+    'disk.create': 0.5,
+    'disk.createfromdistribution': 2.0,
+    'disk.delete': 0.2,
+    'disk.resize': 1.0,
+    'linode.clone': 3.0,
+}
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+
+class Stats(object):
+    """
+    Counts what the fake has been asked to do.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.actions = {}
+
+    def __repr__(self):
+        return '<Stats requests:{} calls:{} in:{} out:{}>'.format(
+            self.requests,
+            self.calls,
+            self.bytes_in,
+            self.bytes_out
+        )
+
+
+class FakeLinodeAPI(object):
+    """
+    In memory implementation of the Linode v3 API.
+
+    :param latency: Seconds added to every HTTP request.
+    :param job_durations: Overrides for `JOB_DURATIONS`.
+    """
+
+    def __init__(self, latency=0, job_durations=None):
+        self.latency = latency
+        self.job_durations = dict(JOB_DURATIONS)
+        self.job_durations.update(job_durations or {})
+
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1000)
+        self.stats = Stats()
+
+        self.linodes = {}
+        self.disks = {}
+        self.configs = {}
+        self.ips = {}
+        self.jobs = {}
+
+    def handle_request(self, body):
+        """
+        Handle the form encoded `body` of an HTTP request, returning the
+        encoded response.
+        """
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+
+        params = dict(parse_qsl(body or '', keep_blank_values=True))
+        response = json.dumps(self.handle(params)).encode('utf-8')
+
+        with self.lock:
+            self.stats.requests += 1
+            self.stats.bytes_in += len(body or '')
+            self.stats.bytes_out += len(response)
+
+        return response
+
+    def handle(self, params):
+        action = params.get('api_action', '')
+
+        if action == 'batch':
+            sub_calls = json.loads(params.get('api_requestArray') or '[]')
+
+            return [self.handle(sub_call) for sub_call in sub_calls]
+
+        with self.lock:
+            self.stats.calls += 1
+            self.stats.actions[action] = self.stats.actions.get(action, 0) + 1
+
+            try:
+                method = getattr(self, action.replace('.', '_'))
+            except AttributeError:
+                return self.response(action, errors=[
+                    (4, 'Action not found')
+                ])
+
+            try:
+                data = method(params)
+            except FakeAPIError as exc:
+                return self.response(action, errors=[
+                    (exc.code, exc.message)
+                ])
+
+        return self.response(action, data)
+
+    def response(self, action, data=None, errors=()):
+        return {
+            'ACTION': action,
+            'DATA': data if data is not None else {},
+            'ERRORARRAY': [
+                {'ERRORCODE': code, 'ERRORMESSAGE': message}
+                for code, message in errors
+            ]
+        }
+
+    def int_param(self, params, name, required=True):
+        value = params.get(name)
+
+        if value in (None, '', 'null'):
+            if required:
+                raise FakeAPIError(6, '{} is required'.format(name))
+
+            return None
+
+        return int(value)
+
+    def bool_param(self, params, name):
+        return str(params.get(name, '')).lower() in ('1', 'true')
+
+    def get_linode(self, params):
+        linode_id = self.int_param(params, 'LinodeID')
+
+        try:
+            return self.linodes[linode_id]
+        except KeyError:
+            raise FakeAPIError(5, 'Object not found')
+
+    def add_job(self, linode_id, action, label=''):
+        job_id = next(self.ids)
+        now = time.time()
+
+        self.jobs.setdefault(linode_id, {})[job_id] = {
+            'JOBID': job_id,
+            'LINODEID': linode_id,
+            'ACTION': action,
+            'LABEL': label,
+            'entered': now,
+            'duration': self.job_durations.get(action, 0),
+        }
+
+        return job_id
+
+    def job_to_json(self, job, now):
+        finish = job['entered'] + job['duration']
+        finished = now >= finish
+
+        def format_date(value):
+            return datetime.fromtimestamp(value).strftime(DATE_FORMAT)
+
+        return {
+            'JOBID': job['JOBID'],
+            'LINODEID': job['LINODEID'],
+            'ACTION': job['ACTION'],
+            'LABEL': job['LABEL'],
+            'ENTERED_DT': format_date(job['entered']),
+            'HOST_START_DT': format_date(job['entered']),
+            'HOST_FINISH_DT': format_date(finish) if finished else '',
+            'DURATION': int(round(job['duration'])) if finished else '',
+            'HOST_MESSAGE': '',
+            'HOST_SUCCESS': 1 if finished else '',
+        }
+
+    def seed(self, count, datacenter_id=7, plan_id=1):
+        """
+        Create `count` linodes, each with a disk, swap disk, configuration
+        profile and private IP, without going through the API. The jobs
+        creating them have already finished.
+
+        :returns: The ids of the new linodes.
+        """
+        linode_ids = []
+
+        with self.lock:
+            for _ in compat.range(count):
+                linode_id = self.linode_create({
+                    'DatacenterID': datacenter_id,
+                    'PlanID': plan_id
+                })['LinodeID']
+
+                disk = self.add_disk(
+                    linode_id,
+                    'Disk Image',
+                    'ext4',
+                    24320,
+                    'disk.createfromdistribution'
+                )
+                swap = self.add_disk(
+                    linode_id,
+                    'Swap Image',
+                    'swap',
+                    256,
+                    'disk.create'
+                )
+
+                self.linode_config_create({
+                    'LinodeID': linode_id,
+                    'KernelID': 138,
+                    'Label': 'Profile',
+                    'DiskList': '{},{}'.format(disk['DiskID'], swap['DiskID'])
+                })
+                self.add_ip(linode_id, False)
+
+                for job in self.jobs[linode_id].values():
+                    job['entered'] -= job['duration']
+
+                linode_ids.append(linode_id)
+
+        return linode_ids
+
+    # avail.*
+
+    def avail_datacenters(self, params):
+        return DATACENTERS
+
+    def avail_linodeplans(self, params):
+        return PLANS
+
+    def avail_distributions(self, params):
+        return DISTRIBUTIONS
+
+    def avail_kernels(self, params):
+        return KERNELS
+
+    # linode.*
+
+    def linode_list(self, params):
+        linode_id = self.int_param(params, 'LinodeID', False)
+
+        if linode_id is not None:
+            linode = self.linodes.get(linode_id)
+
+            return [linode] if linode else []
+
+        return [self.linodes[key] for key in sorted(self.linodes)]
+
+    def linode_create(self, params):
+        datacenter_id = self.int_param(params, 'DatacenterID')
+        plan_id = self.int_param(params, 'PlanID')
+
+        if datacenter_id not in [dc['DATACENTERID'] for dc in DATACENTERS]:
+            raise FakeAPIError(5, 'Invalid DatacenterID')
+
+        if plan_id not in [plan['PLANID'] for plan in PLANS]:
+            raise FakeAPIError(5, 'Invalid PlanID')
+
+        linode_id = next(self.ids)
+
+        self.linodes[linode_id] = {
+            'LINODEID': linode_id,
+            'LABEL': 'linode{}'.format(linode_id),
+            'DATACENTERID': datacenter_id,
+            'PLANID': plan_id,
+            'STATUS': 0,
+        }
+        self.disks[linode_id] = {}
+        self.configs[linode_id] = {}
+        self.ips[linode_id] = {}
+        self.jobs[linode_id] = {}
+
+        self.add_ip(linode_id, True)
+
+        return {'LinodeID': linode_id}
+
+    def linode_clone(self, params):
+        source = self.get_linode(params)
+
+        response = self.linode_create(params)
+        linode_id = response['LinodeID']
+
+        disk_ids = {}
+
+        for disk in list(self.disks[source['LINODEID']].values()):
+            disk_id = disk_ids[str(disk['DISKID'])] = next(self.ids)
+
+            self.disks[linode_id][disk_id] = dict(
+                disk,
+                DISKID=disk_id,
+                LINODEID=linode_id
+            )
+
+        for config in list(self.configs[source['LINODEID']].values()):
+            config_id = next(self.ids)
+            disk_list = [
+                disk_ids.get(value, '')
+                for value in config['DiskList'].split(',')
+            ]
+
+            self.configs[linode_id][config_id] = dict(
+                config,
+                ConfigID=config_id,
+                LinodeID=linode_id,
+                DiskList=','.join(str(value) for value in disk_list)
+            )
+
+        self.add_job(linode_id, 'linode.clone')
+
+        return response
+
+    def linode_delete(self, params):
+        linode = self.get_linode(params)
+        linode_id = linode['LINODEID']
+
+        if not self.bool_param(params, 'skipChecks'):
+            if self.disks[linode_id]:
+                raise FakeAPIError(
+                    8,
+                    'Linode must have no disks before delete'
+                )
+
+        for store in (self.linodes, self.disks, self.configs, self.ips,
+                      self.jobs):
+            store.pop(linode_id, None)
+
+        return {'LinodeID': linode_id}
+
+    def linode_update(self, params):
+        linode = self.get_linode(params)
+
+        if 'Label' in params:
+            linode['LABEL'] = params['Label']
+
+        return {'LinodeID': linode['LINODEID']}
+
+    def linode_resize(self, params):
+        linode = self.get_linode(params)
+
+        linode['PLANID'] = self.int_param(params, 'PlanID')
+
+        return {}
+
+    def power_job(self, params, action, status):
+        linode = self.get_linode(params)
+        linode['STATUS'] = status
+
+        return {'JobID': self.add_job(linode['LINODEID'], action)}
+
+    def linode_boot(self, params):
+        return self.power_job(params, 'linode.boot', 1)
+
+    def linode_reboot(self, params):
+        return self.power_job(params, 'linode.reboot', 1)
+
+    def linode_shutdown(self, params):
+        return self.power_job(params, 'linode.shutdown', 2)
+
+    # linode.disk.*
+
+    def linode_disk_list(self, params):
+        linode = self.get_linode(params)
+        disks = self.disks[linode['LINODEID']]
+        disk_id = self.int_param(params, 'DiskID', False)
+
+        if disk_id is not None:
+            return [disks[disk_id]] if disk_id in disks else []
+
+        return [disks[key] for key in sorted(disks)]
+
+    def add_disk(self, linode_id, label, type, size, action):
+        disk_id = next(self.ids)
+
+        self.disks[linode_id][disk_id] = {
+            'DISKID': disk_id,
+            'LINODEID': linode_id,
+            'LABEL': label,
+            'TYPE': type,
+            'SIZE': size,
+            'STATUS': 1,
+            'ISREADONLY': 0,
+        }
+
+        return {
+            'DiskID': disk_id,
+            'JobID': self.add_job(linode_id, action, label)
+        }
+
+    def linode_disk_create(self, params):
+        linode = self.get_linode(params)
+
+        return self.add_disk(
+            linode['LINODEID'],
+            params.get('Label', ''),
+            params.get('Type', 'ext4'),
+            self.int_param(params, 'Size'),
+            'disk.create'
+        )
+
+    def linode_disk_createfromdistribution(self, params):
+        linode = self.get_linode(params)
+        distribution_id = self.int_param(params, 'DistributionID')
+
+        if distribution_id not in [
+                data['DISTRIBUTIONID'] for data in DISTRIBUTIONS]:
+            raise FakeAPIError(5, 'Invalid DistributionID')
+
+        if not params.get('rootPass'):
+            raise FakeAPIError(6, 'rootPass is required')
+
+        return self.add_disk(
+            linode['LINODEID'],
+            params.get('Label', ''),
+            'ext4',
+            self.int_param(params, 'Size'),
+            'disk.createfromdistribution'
+        )
+
+    def get_disk(self, params):
+        linode = self.get_linode(params)
+        disk_id = self.int_param(params, 'DiskID')
+
+        try:
+            return self.disks[linode['LINODEID']][disk_id]
+        except KeyError:
+            raise FakeAPIError(5, 'Object not found')
+
+    def linode_disk_delete(self, params):
+        disk = self.get_disk(params)
+        linode_id = disk['LINODEID']
+
+        del self.disks[linode_id][disk['DISKID']]
+
+        return {
+            'DiskID': disk['DISKID'],
+            'JobID': self.add_job(linode_id, 'disk.delete')
+        }
+
+    def linode_disk_update(self, params):
+        disk = self.get_disk(params)
+
+        if 'Label' in params:
+            disk['LABEL'] = params['Label']
+
+        return {'DiskID': disk['DISKID']}
+
+    def linode_disk_resize(self, params):
+        disk = self.get_disk(params)
+        disk['SIZE'] = self.int_param(params, 'size')
+
+        return {
+            'DiskID': disk['DISKID'],
+            'JobID': self.add_job(disk['LINODEID'], 'disk.resize')
+        }
+
+    # linode.config.*
+
+    def linode_config_list(self, params):
+        linode = self.get_linode(params)
+        configs = self.configs[linode['LINODEID']]
+        config_id = self.int_param(params, 'ConfigID', False)
+
+        if config_id is not None:
+            return [configs[config_id]] if config_id in configs else []
+
+        return [configs[key] for key in sorted(configs)]
+
+    def config_fields(self, params, config):
+        for name in ('Label', 'Comments', 'DiskList', 'RunLevel',
+                     'RootDeviceCustom', 'devtmpfs_automount'):
+            if name in params:
+                config[name] = params[name]
+
+        for name in ('KernelID', 'RAMLimit', 'RootDeviceNum', 'RootDeviceRO',
+                     'helper_disableUpdateDB', 'helper_xen',
+                     'helper_depmod'):
+            if name in params:
+                config[name] = self.int_param(params, name, False)
+
+    def linode_config_create(self, params):
+        linode = self.get_linode(params)
+        self.int_param(params, 'KernelID')
+
+        config_id = next(self.ids)
+
+        config = {
+            'ConfigID': config_id,
+            'LinodeID': linode['LINODEID'],
+            'KernelID': None,
+            'Label': '',
+            'Comments': '',
+            'RAMLimit': 0,
+            'DiskList': ',,,,,,,,',
+            'RunLevel': 'default',
+            'RootDeviceNum': 1,
+            'RootDeviceCustom': '',
+            'RootDeviceRO': 1,
+            'helper_disableUpdateDB': 1,
+            'helper_xen': 1,
+            'helper_depmod': 1,
+            'devtmpfs_automount': 'true',
+        }
+
+        self.config_fields(params, config)
+        self.configs[linode['LINODEID']][config_id] = config
+
+        return {'ConfigID': config_id}
+
+    def get_config(self, params):
+        linode = self.get_linode(params)
+        config_id = self.int_param(params, 'ConfigID')
+
+        try:
+            return self.configs[linode['LINODEID']][config_id]
+        except KeyError:
+            raise FakeAPIError(5, 'Object not found')
+
+    def linode_config_update(self, params):
+        config = self.get_config(params)
+
+        self.config_fields(params, config)
+
+        return {'ConfigID': config['ConfigID']}
+
+    def linode_config_delete(self, params):
+        config = self.get_config(params)
+
+        del self.configs[config['LinodeID']][config['ConfigID']]
+
+        return {'ConfigID': config['ConfigID']}
+
+    # linode.ip.*
+
+    def add_ip(self, linode_id, public):
+        address_id = next(self.ids)
+
+        if public:
+            address = '203.0.{}.{}'.format(address_id // 250 % 250,
+                                           address_id % 250 + 1)
+        else:
+            address = '192.168.{}.{}'.format(address_id // 250 % 250,
+                                             address_id % 250 + 1)
+
+        self.ips[linode_id][address_id] = {
+            'IPADDRESSID': address_id,
+            'LINODEID': linode_id,
+            'IPADDRESS': address,
+            'ISPUBLIC': int(public),
+            'RDNS_NAME': '',
+        }
+
+        return address_id
+
+    def linode_ip_list(self, params):
+        linode = self.get_linode(params)
+        ips = self.ips[linode['LINODEID']]
+        address_id = self.int_param(params, 'IPAddressID', False)
+
+        if address_id is not None:
+            return [ips[address_id]] if address_id in ips else []
+
+        return [ips[key] for key in sorted(ips)]
+
+    def linode_ip_addprivate(self, params):
+        linode = self.get_linode(params)
+
+        address_id = self.add_ip(linode['LINODEID'], False)
+
+        return {
+            'IPAddressID': address_id,
+            'IPAddress': self.ips[linode['LINODEID']][address_id]['IPADDRESS']
+        }
+
+    # linode.job.*
+
+    def linode_job_list(self, params):
+        linode = self.get_linode(params)
+        jobs = self.jobs[linode['LINODEID']]
+        job_id = self.int_param(params, 'JobID', False)
+        pending = self.bool_param(params, 'pendingOnly')
+        now = time.time()
+
+        if job_id is not None:
+            selected = [jobs[job_id]] if job_id in jobs else []
+        else:
+            selected = [jobs[key] for key in sorted(jobs, reverse=True)]
+
+        result = [self.job_to_json(job, now) for job in selected]
+
+        if pending:
+            result = [job for job in result if not job['HOST_FINISH_DT']]
+
+        return result
+
+
+class FakeAdapter(BaseAdapter):
+    """
+    A `requests` transport adapter answering from a `FakeLinodeAPI`.
+    """
+
+    def __init__(self, api):
+        super(FakeAdapter, self).__init__()
+
+        self.api = api
+
+    def send(self, request, **kwargs):
+        if self.api.latency:
+            time.sleep(self.api.latency)
+
+        response = Response()
+        response.status_code = 200
+        response._content = self.api.handle_request(request.body)
+        response.request = request
+        response.url = request.url
+
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeTransport(object):
+    """
+    A `linode.aio` transport answering from a `FakeLinodeAPI`.
+    """
+
+    def __init__(self, api):
+        self.api = api
+
+    def post(self, api_key, url, data):
+        import asyncio
+
+        try:
+            from urllib.parse import urlencode
+        except ImportError:
+            from urllib import urlencode
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def respond():
+            if not future.cancelled():
+                future.set_result((200, self.api.handle_request(
+                    urlencode(data)
+                )))
+
+        loop.call_later(self.api.latency, respond)
+
+        return future
+
+    def close(self):
+        # awaitable, like the `close` coroutine of the other transports
+        import asyncio
+
+        return asyncio.sleep(0)
+
+
+def install(latency=0, job_durations=None, pool=None):
+    """
+    Route every request made through the session pool and the `linode.aio`
+    transport to a new fake API.
+
+    :returns: The `FakeLinodeAPI` instance.
+    """
+    api = FakeLinodeAPI(latency, job_durations)
+    pool = pool or session.default_pool
+
+    pool.mount(base.API_URL, FakeAdapter(api))
+
+    base.fake_api = api
+
+    import sys
+
+    # otherwise `aio.get_transport` picks up `base.fake_api` when it is
+    # first called
+    aio = sys.modules.get('linode.aio')
+
+    if aio is not None:
+        aio.set_transport(FakeTransport(api))
+
+    return api
+
+
+def uninstall(pool=None):
+    pool = pool or session.default_pool
+
+    pool.unmount(base.API_URL)
+
+    base.fake_api = None
+
+    import sys
+
+    aio = sys.modules.get('linode.aio')
+
+    if aio is not None and isinstance(aio._transport, FakeTransport):
+        aio.set_transport(None)
@@ -1,18 +1,53 @@
-import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, wait
+import concurrent.futures
+import functools
+import math
+import threading
 
-from . import base
+from . import base, compat, errors, metrics, retry
+
+
+# seconds between polls of the job list, for actions with no duration
+# estimate yet (see `get_estimates`)
+POLL_INTERVAL = 5
+
+_durations = {}
+_durations_lock = threading.Lock()
+_future_lock = threading.Lock()
 
 
 class JobError(Exception):
     def __init__(self, job):
         self.job = job
 
+    def __str__(self):
+        return 'Job {} ({}) failed: {}'.format(
+            self.job.id,
+            self.job.action,
+            self.job.message
+        )
+
 
 class Job(base.BaseObject):
+    """
+    A Linode job. Besides `wait`, a job can be used like a
+    `concurrent.futures.Future` that resolves to itself once the job has
+    finished (or raises `JobError` if it failed)::
+
+        job.add_done_callback(on_finished)
+
+        for finished in linode.job.as_completed(jobs):
+            finished.result()
+    """
+
     def __init__(self, api_key, id, linode_id, action, label, entered, started,
                  finish, duration, message, success):
         super(Job, self).__init__(api_key, id)
 
+        self._future = None
+        # the poller future `_future` waits for
+        self._source = None
+
         self.linode_id = linode_id
         self.action = action
         self.label = label
@@ -46,32 +81,251 @@ class Job(base.BaseObject):
         if self.finish:
             return self
 
-        finished_job = waitany(self.api_key, self.linode_id, self.id)
+        if not metrics.listeners:
+            return self._wait()
+
+        with metrics.timed(
+                'job.wait',
+                action=self.action,
+                linode_id=self.linode_id,
+                job_id=self.id):
+            return self._wait()
+
+    def _wait(self):
+        finished_job = wait_jobs(
+            self.api_key,
+            self.linode_id,
+            [self.id],
+            action=self.action
+        )[0].result()
 
-        self.__dict__.clear()
-        self.__dict__.update(finished_job.__dict__)
+        self.update_from(finished_job)
 
         if not self.success:
             raise JobError(self)
 
         return self
 
+    def update_from(self, job):
+        """
+        Copy the state of `job` (the same job, fetched later) to this one.
+        """
+        future, source = self._future, self._source
+
+        self.__dict__.update(job.__dict__)
+
+        self._future, self._source = future, source
+
+    def future(self):
+        """
+        Returns a `concurrent.futures.Future` resolved with this job once it
+        has finished, see `linode.poller`. The job is updated in place
+        before the future is resolved.
+        """
+        with _future_lock:
+            if self._future is not None:
+                return self._future
+
+            future = self._future = Future()
+            future.set_running_or_notify_cancel()
+
+        if self.finish:
+            self._set_result(future)
+        else:
+            from . import poller
+
+            source = self._source = poller.watch(
+                self.api_key,
+                self.linode_id,
+                self.id,
+                self.action
+            )
+            source.add_done_callback(
+                functools.partial(self._on_finished, future)
+            )
+
+        return future
+
+    def unwatch(self):
+        """
+        Stop polling for the job if it has not finished yet. The pending
+        future is dropped, a later `future()` call watches the job again.
+        """
+        with _future_lock:
+            future, source = self._future, self._source
+
+            if future is None or future.done() or source is None:
+                return
+
+            self._future = self._source = None
+
+        from . import poller
+
+        poller.unwatch(source)
+
+    def _on_finished(self, future, source):
+        error = source.exception()
+
+        if error is not None:
+            future.set_exception(error)
+
+            return
+
+        self.update_from(source.result())
+        self._set_result(future)
+
+    def _set_result(self, future):
+        if self.success:
+            future.set_result(self)
+        else:
+            future.set_exception(JobError(self))
+
+    def result(self, timeout=None):
+        """
+        Block (at most `timeout` seconds) until the job has finished.
+
+        :returns: The job.
+        :raises JobError: The job failed.
+        :raises concurrent.futures.TimeoutError: `timeout` expired.
+        """
+        return self.future().result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future().exception(timeout)
+
+    def done(self):
+        # from the job state, asking must not start polling
+        return bool(self.finish)
+
+    def running(self):
+        return not self.done()
+
+    def cancel(self):
+        # the job runs on Linode's side, there is nothing to cancel
+        return False
+
+    def cancelled(self):
+        return False
+
+    def add_done_callback(self, fn):
+        """
+        Call `fn(job)` once the job has finished, from the poller thread (or
+        right away if it already has).
+        """
+        self.future().add_done_callback(lambda future: fn(self))
+
+    def wait_async(self):
+        """
+        Awaitable version of `wait`, for use with `linode.aio`::
+
+            await job.wait_async()
+        """
+        from . import aio
+
+        return aio.wait_job(self)
+
+
+class DurationStats(object):
+    """
+    Running count, mean and variance (Welford) of the `Job.duration` of one
+    action.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def stddev(self):
+        if self.count < 2:
+            return 0.0
+
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'stddev': self.stddev,
+            'min': self.min,
+            'max': self.max,
+        }
+
+
+def record_duration(action, duration):
+    """
+    Add the `duration` (in seconds) of a finished `action` job to the
+    statistics used to schedule polls.
+    """
+    if duration is None:
+        return
+
+    with _durations_lock:
+        try:
+            stats = _durations[action]
+        except KeyError:
+            stats = _durations[action] = DurationStats()
+
+        stats.add(float(duration))
+
+
+def get_estimate(action):
+    """
+    Returns the expected duration of an `action` job in seconds, or `None`
+    if none has been seen finishing yet.
+    """
+    stats = _durations.get(action)
+
+    if stats is None:
+        return None
+
+    return stats.mean
+
+
+def get_estimates():
+    """
+    Returns the learned job durations as a dict of `action` to a dict of
+    `count`, `mean`, `stddev`, `min` and `max` (in seconds).
+    """
+    with _durations_lock:
+        return dict(
+            (action, stats.to_dict())
+            for action, stats in _durations.items()
+        )
+
+
+def reset_estimates():
+    with _durations_lock:
+        _durations.clear()
+
 
 def convert_to_job_id(value):
     if isinstance(value, Job):
         return value.id
 
-    if isinstance(value, (int, long)):
+    if isinstance(value, compat.integer_types):
         return value
 
     return int(value)
 
 
-def get(api_key, linode_id, *jobs, **kwargs):
-    job_ids = map(convert_to_job_id, jobs)
-    pending = kwargs.get('pending', None)
-    multiple = kwargs.pop('multiple', False)
-
+def get_batcher(api_key, linode_id, job_ids, pending=None):
+    """
+    Returns an `APIBatcher` with one `linode.job.list` call per job id.
+    """
     batcher = base.APIBatcher(api_key)
 
     for job_id in job_ids:
@@ -88,9 +342,17 @@ def get(api_key, linode_id, *jobs, **kwargs):
             **kwargs
         )
 
+    return batcher
+
+
+def from_results(api_key, results):
+    """
+    Convert the results of a `get_batcher` batch into `Job` instances (or
+    `None` where the job could not be found).
+    """
     jobs = []
 
-    for result in batcher.execute():
+    for result in results:
         try:
             data = result[0]
         except IndexError:
@@ -103,12 +365,109 @@ def get(api_key, linode_id, *jobs, **kwargs):
 
         jobs.append(value)
 
+    return jobs
+
+
+def from_response(api_key, linode_id, response, action):
+    """
+    Returns a `Job` for the `JobID` in the `response` of a call that started
+    an `action` job, so it can be waited for without fetching it first.
+    """
+    return Job(
+        api_key,
+        id=response['JobID'],
+        linode_id=linode_id,
+        action=action,
+        label=None,
+        entered=None,
+        started=None,
+        finish=None,
+        duration=None,
+        message=None,
+        success=None
+    )
+
+
+def get(api_key, linode_id, *jobs, **kwargs):
+    job_ids = [convert_to_job_id(job) for job in jobs]
+    pending = kwargs.get('pending', None)
+    multiple = kwargs.pop('multiple', False)
+
+    batcher = get_batcher(api_key, linode_id, job_ids, pending)
+
+    jobs = from_results(api_key, batcher.execute())
+
     if len(jobs) == 1 and not multiple:
         return jobs[0]
 
     return jobs
 
 
+def wait_jobs(api_key, linode_id, job_ids, return_when=ALL_COMPLETED,
+              action=None):
+    """
+    Wait (until the current deadline) for the shared poller, see
+    `linode.poller`, to see the jobs `job_ids` finish. `action`, if known,
+    lets the poller schedule the first poll from the learned duration.
+
+    :returns: The poller futures, in the order of `job_ids`.
+    """
+    from . import poller
+
+    futures = [
+        poller.watch(api_key, linode_id, job_id, action)
+        for job_id in job_ids
+    ]
+
+    try:
+        done, not_done = wait(
+            futures,
+            timeout=retry.check_deadline(),
+            return_when=return_when
+        )
+
+        if not done or (return_when == ALL_COMPLETED and not_done):
+            raise errors.DeadlineExceeded('Deadline exceeded')
+
+        return futures
+    finally:
+        for future in futures:
+            if not future.done():
+                poller.unwatch(future)
+
+
+def as_completed(jobs, timeout=None):
+    """
+    Yields the `jobs` as they finish, like `concurrent.futures.as_completed`.
+    Failed jobs are yielded too, their `result()` raises `JobError`.
+
+    :raises concurrent.futures.TimeoutError: The jobs did not all finish
+        within `timeout` seconds.
+    :raises DeadlineExceeded: The current deadline passed first.
+    """
+    # the jobs this call started polling for, to stop if it exits early
+    watched = [job for job in jobs if job._future is None]
+    by_future = dict((job.future(), job) for job in jobs)
+
+    left = retry.check_deadline()
+    bounded = left is not None and (timeout is None or left < timeout)
+
+    if bounded:
+        timeout = left
+
+    try:
+        for future in concurrent.futures.as_completed(by_future, timeout):
+            yield by_future[future]
+    except concurrent.futures.TimeoutError:
+        if bounded:
+            raise errors.DeadlineExceeded('Deadline exceeded')
+
+        raise
+    finally:
+        for job in watched:
+            job.unwatch()
+
+
 def waitall(api_key, linode_id, *jobs):
     """
     Waits for all jobs to be complete.
@@ -116,29 +475,22 @@ def waitall(api_key, linode_id, *jobs):
     if not jobs:
         return []
 
-    job_ids = map(convert_to_job_id, jobs)
+    job_ids = [convert_to_job_id(job) for job in jobs]
 
-    while True:
-        pending_jobs = get(api_key, linode_id, *job_ids, multiple=True)
+    for future in wait_jobs(api_key, linode_id, job_ids):
+        # raises the error the poller got, if any
+        future.result()
 
-        if all(filter(lambda job: bool(job.finish), pending_jobs)):
-            # all jobs are finished
-            return jobs
-
-        time.sleep(5)
+    return jobs
 
 
 def waitany(api_key, linode_id, *jobs):
     if not jobs:
         return []
 
-    job_ids = map(convert_to_job_id, jobs)
-
-    while True:
-        pending_jobs = get(api_key, linode_id, *job_ids, multiple=True)
-
-        for job in pending_jobs:
-            if job.finish:
-                return job
+    job_ids = [convert_to_job_id(job) for job in jobs]
+    futures = wait_jobs(api_key, linode_id, job_ids, FIRST_COMPLETED)
 
-        time.sleep(5)
+    for future in futures:
+        if future.done():
+            return future.result()
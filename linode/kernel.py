@@ -1,9 +1,12 @@
 import re
 
-from . import base, cache
+from . import base, cache, compat
 
 
 class Kernel(base.BaseObject):
+    label_attr = 'label'
+    label_match = 'search'
+
     def __init__(self, api_key, id, label):
         super(Kernel, self).__init__(api_key, id)
 
@@ -21,10 +24,10 @@ class Kernel(base.BaseObject):
         return self.label
 
     def __eq__(self, value):
-        if isinstance(value, basestring):
+        if isinstance(value, compat.string_types):
             return bool(re.search(value.lower(), self.label.lower()))
 
-        if isinstance(value, (int, long)):
+        if isinstance(value, compat.integer_types):
             return value == self.id
 
         return False
@@ -39,18 +42,8 @@ class Kernel(base.BaseObject):
 
 
 def load_kernels(api_key):
-    try:
-        result = cache.read_from_cache('kernels')
-    except:
-        result = base.make_single_call(
-            api_key,
-            'avail.kernels'
-        )
-
-        cache.write_to_cache('kernels', result)
-
-    return [Kernel.from_json(api_key, data) for data in result]
+    return cache.load_catalog(api_key, 'kernels', Kernel.from_json)
 
 
 def get_kernel(api_key, label):
-    return base.filter(load_kernels(api_key), label)
+    return cache.lookup(api_key, 'kernels', Kernel, label)
@@ -1,4 +1,13 @@
-from . import base, datacenter, plan, ip, job, disk
+from . import base, config, datacenter, plan, ip, job, disk, retry
+
+
+# related objects that `list_linodes` can prefetch, and the action listing
+# them
+_prefetch_actions = {
+    'disks': 'linode.disk.list',
+    'ips': 'linode.ip.list',
+    'configs': 'linode.config.list',
+}
 
 
 class Linode(base.BaseObject):
@@ -46,14 +55,17 @@ class Linode(base.BaseObject):
         if not self.datacenter_id:
             return
 
-        self._datacenter = datacenter.get_datacenter(self.datacenter_id)
+        self._datacenter = datacenter.get_datacenter(
+            self.api_key,
+            self.datacenter_id
+        )
 
         return self._datacenter
 
     @datacenter.setter
     def datacenter(self, value):
         self.datacenter_id = value.id
-        self._dc = value
+        self._datacenter = value
 
     def boot(self, block=True):
         """
@@ -81,17 +93,37 @@ class Linode(base.BaseObject):
                 return addr
 
     def get_ips(self):
+        if hasattr(self, '_ips'):
+            return self._ips
+
         return ip.get_by_linode(self.api_key, self.id)
 
     def add_private_ip(self):
-        addr = ip.add_private_ip(self.api_key, self.id)
+        addr = ip.add_private(self.api_key, self.id)
+
+        # prefetched ips are now stale
+        self.__dict__.pop('_ips', None)
 
         return addr
 
     @property
     def disks(self):
+        """
+        The disks of the linode, as prefetched by `list_linodes` if it was
+        asked to (see there), otherwise fetched on each access.
+        """
+        if hasattr(self, '_disks'):
+            return self._disks
+
         return list(disk.get_by_linode(self.api_key, self.id))
 
+    @property
+    def configs(self):
+        if hasattr(self, '_configs'):
+            return self._configs
+
+        return config.list_config(self.api_key, self.id)
+
     def remove(self, skip_check):
         self.client(
             'linode.delete',
@@ -99,7 +131,18 @@ class Linode(base.BaseObject):
         )
 
 
-def list_linodes(api_key, linode_id=None):
+def list_linodes(api_key, linode_id=None, prefetch=None):
+    """
+    List the linodes on the account.
+
+    :param linode_id: Only return the linode with this id.
+    :param prefetch: Related objects to load up front for every linode, any
+        of `'disks'`, `'ips'`, `'configs'`, `'plan'` and `'datacenter'`.
+        Lists are fetched with chunked batch calls rather than one request
+        per linode and access. Prefetched lists are snapshots: disks, ips
+        or configs created or deleted afterwards are not reflected, except
+        for ips added with `Linode.add_private_ip`.
+    """
     kwargs = {}
 
     if linode_id:
@@ -111,7 +154,67 @@ def list_linodes(api_key, linode_id=None):
         **kwargs
     )
 
-    return [Linode.from_json(api_key, data) for data in response]
+    linodes = [Linode.from_json(api_key, data) for data in response]
+
+    if prefetch and linodes:
+        prefetch_related(api_key, linodes, prefetch)
+
+    return linodes
+
+
+def prefetch_related(api_key, linodes, related):
+    """
+    Load the `related` objects (see `list_linodes`) of all `linodes` and
+    attach them.
+    """
+    related = set(related)
+    unknown = related - set(_prefetch_actions) - set(['plan', 'datacenter'])
+
+    if unknown:
+        raise ValueError('Cannot prefetch {}'.format(', '.join(unknown)))
+
+    if 'plan' in related:
+        plans = plan.load_plans(api_key).by_id
+
+        for linode in linodes:
+            linode._plan = plans.get(linode.plan_id)
+
+    if 'datacenter' in related:
+        datacenters = datacenter.load_datacenters(api_key).by_id
+
+        for linode in linodes:
+            linode._datacenter = datacenters.get(linode.datacenter_id)
+
+    names = [name for name in sorted(_prefetch_actions) if name in related]
+
+    if not names:
+        return
+
+    batcher = base.APIBatcher(api_key)
+
+    for linode in linodes:
+        for name in names:
+            batcher.add(_prefetch_actions[name], LinodeID=linode.id)
+
+    results = iter(batcher.execute())
+
+    for linode in linodes:
+        for name in names:
+            result = next(results)
+
+            if isinstance(result, Exception):
+                raise result
+
+            if name == 'disks':
+                value = [disk.Disk.from_json(api_key, data) for data in result]
+            elif name == 'ips':
+                value = [ip.IP.from_json(api_key, data) for data in result]
+            else:
+                value = [
+                    config.Config.from_json(api_key, data) for data in result
+                ]
+
+            setattr(linode, '_' + name, value)
 
 
 def get_by_id(api_key, linode_id):
@@ -207,6 +310,141 @@ def delete_linode(api_key, linode_id, skip_checks=False):
     )
 
 
+def delete_linodes(api_key, linodes, skip_checks=False, timeout=None,
+                   progress=None):
+    """
+    Delete many linodes, sending each step for all of them as chunked batch
+    calls and polling their jobs together (see `linode.poller`).
+
+    Without `skip_checks` the running linodes are first shut down and all
+    their disks deleted, as the API requires. A linode that fails a step is
+    left out of the following ones, without affecting the others.
+
+    :param linodes: `Linode` instances or linode ids.
+    :param skip_checks: Delete the linodes straight away, with their disks.
+    :param timeout: Seconds the whole teardown may take. Raises
+        `DeadlineExceeded` when it runs out.
+    :param progress: Called as `progress(linode_id, step, value)` as each
+        linode goes through the steps `'shutdown'` and `'disks'` (unless
+        `skip_checks`), then `'deleted'`, all with `None`, or `'failed'` with
+        the exception.
+    :returns: A list with, for each linode, `None` once deleted or the
+        exception that made it fail.
+    """
+    linode_ids = [getattr(linode, 'id', linode) for linode in linodes]
+    errors = {}
+
+    def report(linode_id, step, value=None):
+        if progress:
+            progress(linode_id, step, value)
+
+    def fail(linode_id, exc):
+        if linode_id not in errors:
+            errors[linode_id] = exc
+            report(linode_id, 'failed', exc)
+
+    def send(calls):
+        """
+        Send the `(linode_id, action, kwargs)` calls as one chunked batch.
+        Returns `(linode_id, action, result)` for the calls that succeeded.
+        """
+        batcher = base.APIBatcher(api_key)
+
+        for linode_id, action, kwargs in calls:
+            batcher.add(action, **kwargs)
+
+        succeeded = []
+
+        for (linode_id, action, _), result in zip(calls, batcher.execute()):
+            if isinstance(result, Exception):
+                fail(linode_id, result)
+            else:
+                succeeded.append((linode_id, action, result))
+
+        return succeeded
+
+    def wait(responses, action):
+        """
+        Wait for the jobs started by `responses`, failing the linodes of the
+        jobs that failed or could not be polled.
+        """
+        jobs = dict(
+            (job.from_response(api_key, linode_id, response, action),
+             linode_id)
+            for linode_id, _, response in responses
+        )
+
+        for finished in job.as_completed(jobs):
+            try:
+                finished.result()
+            except Exception as exc:
+                fail(jobs[finished], exc)
+
+    def live(linode_ids):
+        return [
+            linode_id for linode_id in linode_ids if linode_id not in errors
+        ]
+
+    with retry.deadline(timeout):
+        if not skip_checks:
+            calls = []
+
+            for linode_id in linode_ids:
+                calls.append(
+                    (linode_id, 'linode.list', {'LinodeID': linode_id})
+                )
+                calls.append(
+                    (linode_id, 'linode.disk.list', {'LinodeID': linode_id})
+                )
+
+            running = set()
+            disk_ids = dict((linode_id, []) for linode_id in linode_ids)
+
+            for linode_id, action, result in send(calls):
+                if action == 'linode.disk.list':
+                    disk_ids[linode_id].extend(
+                        data['DISKID'] for data in result
+                    )
+                elif not result:
+                    fail(linode_id, LookupError(
+                        'Linode {} not found'.format(linode_id)
+                    ))
+                elif result[0]['STATUS'] == 1:
+                    running.add(linode_id)
+
+            wait(send([
+                (linode_id, 'linode.shutdown', {'LinodeID': linode_id})
+                for linode_id in live(linode_ids)
+                if linode_id in running
+            ]), 'linode.shutdown')
+
+            for linode_id in live(linode_ids):
+                report(linode_id, 'shutdown')
+
+            wait(send([
+                (linode_id, 'linode.disk.delete', {
+                    'LinodeID': linode_id,
+                    'DiskID': disk_id
+                })
+                for linode_id in live(linode_ids)
+                for disk_id in disk_ids[linode_id]
+            ]), 'disk.delete')
+
+            for linode_id in live(linode_ids):
+                report(linode_id, 'disks')
+
+        for linode_id, _, _ in send([
+            (linode_id, 'linode.delete', {
+                'LinodeID': linode_id,
+                'skipChecks': skip_checks
+            })
+            for linode_id in live(linode_ids)
+        ]):
+            report(linode_id, 'deleted')
+
+    return [errors.get(linode_id) for linode_id in linode_ids]
+
+
 def reboot_linode(api_key, linode_id, config_id=None, block=True):
     """
     Reboot a linode.
@@ -0,0 +1,154 @@
+"""
+Opt-in short lived cache of read-only list responses.
+
+Operations such as `provision` list the disks, ips or jobs of a linode
+several times within a few seconds. When enabled, `base.make_single_call`
+answers repeated list calls with the same arguments from memory for `ttl`
+seconds::
+
+    from linode import listcache
+
+    listcache.enable(ttl=2)
+
+Any other (mutating) call, single or batched, drops the cached responses
+for its `LinodeID`, or for the whole api key when it has no `LinodeID`
+(e.g. `linode.create`).
+"""
+import threading
+import time
+
+from . import base, retry
+
+
+# actions whose responses are cached
+CACHED_ACTIONS = frozenset([
+    'linode.list',
+    'linode.disk.list',
+    'linode.ip.list',
+    'linode.config.list',
+    'linode.job.list',
+])
+
+
+class ResponseCache(object):
+    """
+    :param ttl: Seconds a response is served from memory.
+    :param actions: Names of the actions to cache.
+    """
+
+    def __init__(self, ttl=2, actions=CACHED_ACTIONS):
+        self.ttl = ttl
+        self.actions = frozenset(actions)
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        # bumped by every write, so a read sent before a write does not
+        # store its (possibly stale) response after it
+        self.generations = {}
+
+    def get_key(self, api_key, action, kwargs):
+        if action not in self.actions:
+            return None
+
+        key = (api_key, action, tuple(sorted(kwargs.items())))
+
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def call(self, api_key, action, kwargs, send):
+        """
+        Returns the cached response of `action` or calls `send()`. Writes
+        invalidate the cache before and after `send()`.
+        """
+        key = self.get_key(api_key, action, kwargs)
+
+        if key is None:
+            if not retry.is_read_only(action, kwargs):
+                self.invalidate_calls(api_key, [(action, kwargs)])
+
+                try:
+                    return send()
+                finally:
+                    self.invalidate_calls(api_key, [(action, kwargs)])
+
+            return send()
+
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            generation = self.generations.get(api_key, 0)
+
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        result = send()
+
+        with self.lock:
+            if self.generations.get(api_key, 0) == generation:
+                self.entries[key] = (time.time() + self.ttl, result)
+
+        return result
+
+    def invalidate_calls(self, api_key, calls):
+        """
+        Drop the responses made stale by the `(action, kwargs)` `calls`.
+        """
+        linode_ids = set()
+
+        for action, kwargs in calls:
+            if retry.is_read_only(action, kwargs):
+                continue
+
+            linode_id = kwargs.get('LinodeID')
+
+            if linode_id is None:
+                self.invalidate(api_key)
+
+                return
+
+            linode_ids.add(int(linode_id))
+
+        for linode_id in linode_ids:
+            self.invalidate(api_key, linode_id)
+
+    def invalidate(self, api_key=None, linode_id=None):
+        """
+        Drop the cached responses of `api_key` (default all) about
+        `linode_id`. `linode.list` responses for all linodes of the key are
+        dropped too.
+        """
+        with self.lock:
+            for key in list(self.entries):
+                if api_key is not None and key[0] != api_key:
+                    continue
+
+                if linode_id is not None:
+                    entry_id = dict(key[2]).get('LinodeID')
+
+                    if entry_id is not None and int(entry_id) != linode_id:
+                        continue
+
+                del self.entries[key]
+
+            if api_key is None:
+                for name in self.generations:
+                    self.generations[name] += 1
+            else:
+                self.generations[api_key] = (
+                    self.generations.get(api_key, 0) + 1
+                )
+
+
+def enable(ttl=2, actions=CACHED_ACTIONS):
+    base.response_cache = ResponseCache(ttl, actions)
+
+    return base.response_cache
+
+
+def disable():
+    base.response_cache = None
@@ -0,0 +1,271 @@
+"""
+Instrumentation hooks for API calls, batches and job waits.
+
+Listeners are callables taking an `Event`. Nothing is measured unless at
+least one listener is registered::
+
+    from linode import metrics
+
+    def to_statsd(event):
+        statsd.timing('linode.' + event.action, event.latency * 1000)
+
+    metrics.add_listener(to_statsd)
+
+`Aggregator` is a built-in listener keeping latency histograms per action::
+
+    aggregator = metrics.Aggregator()
+    metrics.add_listener(aggregator)
+    ...
+    aggregator.dump()
+
+Events:
+
+* `call` - one `make_linode_call`: `action`, `latency`, `retries`,
+  `hedges` (extra copies sent by a hedging `RetryPolicy`), `request_bytes`,
+  `response_bytes`, `batch_size` and `error`.
+* `batch` - one `make_batch_call`: `action` (`'batch'`), `latency`,
+  `batch_size` (number of sub-calls), `chunks` and `error`.
+* `job.wait` - one `Job.wait`: `action` (the job action), `latency`,
+  `linode_id`, `job_id` and `error`.
+"""
+import bisect
+import contextlib
+import sys
+import threading
+import time
+
+
+listeners = []
+
+_fields_lock = threading.Lock()
+
+
+class Event(object):
+    def __init__(self, name, **fields):
+        self.name = name
+        self.action = None
+        self.latency = 0
+        self.retries = 0
+        self.hedges = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.batch_size = 1
+        self.error = None
+
+        self.__dict__.update(fields)
+
+        if 'attempts' in fields:
+            self.retries = max(0, fields['attempts'] - 1)
+
+    def __repr__(self):
+        return '<Event {} {} {:.3f}s>'.format(
+            self.name,
+            self.action,
+            self.latency
+        )
+
+
+def add_listener(listener):
+    listeners.append(listener)
+
+
+def remove_listener(listener):
+    listeners.remove(listener)
+
+
+def emit(name, **fields):
+    """
+    Send an event to every listener. Callers should check `listeners`
+    first so that nothing is computed when there is no one listening.
+    """
+    event = Event(name, **fields)
+
+    for listener in list(listeners):
+        listener(event)
+
+
+@contextlib.contextmanager
+def timed(name, **fields):
+    """
+    Emit a `name` event with the time taken by the body of the `with`
+    block, and the exception it raised (if any). The fields dict is yielded
+    so the body can add to it.
+    """
+    start = time.time()
+
+    try:
+        yield fields
+    except Exception as exc:
+        fields['error'] = exc
+
+        raise
+    finally:
+        fields['latency'] = time.time() - start
+
+        emit(name, **fields)
+
+
+def add(fields, name, value=1):
+    """
+    Add `value` to the `name` field of the dict yielded by `timed`. Safe to
+    call from several threads, e.g. those sending hedged requests.
+    """
+    with _fields_lock:
+        fields[name] = fields.get(name, 0) + value
+
+
+def encoded_size(params):
+    """
+    Approximate size in bytes of the form encoded request parameters.
+    """
+    return sum(len(name) + len(value) + 2 for name, value in params.items())
+
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = [0.001 * 2 ** power for power in range(18)]
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the `percent`
+        percentile.
+        """
+        if not self.count:
+            return 0.0
+
+        target = self.count * percent / 100.0
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if seen >= target:
+                if index < len(BUCKETS):
+                    return min(BUCKETS[index], self.max)
+
+                return self.max
+
+        return self.max
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0.0
+
+        return self.total / self.count
+
+
+class ActionStats(object):
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.batch_size = 0
+
+    def add(self, event):
+        self.latency.add(event.latency)
+        self.errors += int(event.error is not None)
+        self.retries += event.retries
+        self.hedges += event.hedges
+        self.request_bytes += event.request_bytes
+        self.response_bytes += event.response_bytes
+        self.batch_size += event.batch_size
+
+
+class Aggregator(object):
+    """
+    Listener keeping an `ActionStats` per `(event name, action)`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def __call__(self, event):
+        key = (event.name, event.action)
+
+        with self.lock:
+            try:
+                stats = self.stats[key]
+            except KeyError:
+                stats = self.stats[key] = ActionStats()
+
+            stats.add(event)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    def summary(self):
+        """
+        Returns a list of dicts, one per event name and action, slowest
+        total time first.
+        """
+        with self.lock:
+            items = list(self.stats.items())
+
+        rows = []
+
+        for (name, action), stats in items:
+            latency = stats.latency
+
+            rows.append({
+                'event': name,
+                'action': action,
+                'count': latency.count,
+                'errors': stats.errors,
+                'retries': stats.retries,
+                'hedges': stats.hedges,
+                'total': latency.total,
+                'mean': latency.mean,
+                'p50': latency.percentile(50),
+                'p90': latency.percentile(90),
+                'p99': latency.percentile(99),
+                'max': latency.max,
+                'request_bytes': stats.request_bytes,
+                'response_bytes': stats.response_bytes,
+                'batch_size': stats.batch_size,
+            })
+
+        rows.sort(key=lambda row: row['total'], reverse=True)
+
+        return rows
+
+    def dump(self, fp=None):
+        """
+        Write a table of the summary to `fp` (default stdout).
+        """
+        fp = fp or sys.stdout
+
+        fp.write(
+            '{:<9} {:<36} {:>6} {:>4} {:>4} {:>4} {:>9} {:>8} {:>8} '
+            '{:>8} {:>10} {:>10}\n'.format(
+                'event', 'action', 'count', 'err', 'rty', 'hdg', 'total',
+                'p50', 'p90', 'p99', 'sent', 'received'
+            )
+        )
+
+        for row in self.summary():
+            fp.write(
+                '{event:<9} {action:<36} {count:>6} {errors:>4} '
+                '{retries:>4} {hedges:>4} {total:>9.3f} {p50:>8.3f} '
+                '{p90:>8.3f} {p99:>8.3f} {request_bytes:>10} '
+                '{response_bytes:>10}\n'
+                .format(**dict(row, action=str(row['action'])))
+            )
@@ -0,0 +1,240 @@
+"""
+Compact, memory-mappable catalog files.
+
+Used by `linode.cache` when `cache.backend` is `'mmap'`. A file holds every
+record of a catalog as its own JSON document, plus tables to find a record
+by id, label prefix or label suffix with a binary search, so a lookup reads
+a few pages of the file and decodes a single record.
+
+Layout (little-endian):
+
+* header - see `HEADER`.
+* entries - per record: offset and length of its JSON and of its
+  lowercased label.
+* ids - `(id, record index)` pairs sorted by id.
+* prefixes - record indexes sorted by lowercased label.
+* suffixes - record indexes sorted by reversed lowercased label.
+* the labels and records.
+"""
+import mmap
+import re
+import struct
+
+from . import base, codec
+
+
+MAGIC = b'LPYC'
+FORMAT_VERSION = 1
+
+# magic, format version, schema version, record count, fetched_at, scope,
+# offsets of the entries, ids, prefixes and suffixes tables
+HEADER = struct.Struct('<4sHHId16sIIII')
+ENTRY = struct.Struct('<IIII')
+ID = struct.Struct('<qI')
+INDEX = struct.Struct('<I')
+
+
+def dumps(entry, id_field, label_field, schema_version):
+    """
+    Returns the catalog `entry` (see `cache.write_to_cache`) in the mapped
+    format. `id_field` and `label_field` name the record keys to index.
+    """
+    records = entry['data']
+    count = len(records)
+
+    labels = [
+        record[label_field].lower().encode('utf-8')
+        for record in records
+    ]
+    blobs = [codec.dumps_bytes(record) for record in records]
+
+    entries_offset = HEADER.size
+    ids_offset = entries_offset + ENTRY.size * count
+    prefixes_offset = ids_offset + ID.size * count
+    suffixes_offset = prefixes_offset + INDEX.size * count
+    data_offset = suffixes_offset + INDEX.size * count
+
+    chunks = [HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        schema_version,
+        count,
+        entry['fetched_at'],
+        (entry['scope'] or '').encode('ascii'),
+        entries_offset,
+        ids_offset,
+        prefixes_offset,
+        suffixes_offset
+    )]
+
+    offset = data_offset
+    data = []
+
+    for label, blob in zip(labels, blobs):
+        chunks.append(ENTRY.pack(
+            offset + len(label),
+            len(blob),
+            offset,
+            len(label)
+        ))
+        data.extend([label, blob])
+
+        offset += len(label) + len(blob)
+
+    ids = sorted(
+        (int(record[id_field]), index)
+        for index, record in enumerate(records)
+    )
+    chunks.extend(ID.pack(*pair) for pair in ids)
+
+    text = [label.decode('utf-8') for label in labels]
+
+    for key in (lambda index: text[index], lambda index: text[index][::-1]):
+        order = sorted(range(count), key=lambda index: (key(index), index))
+        chunks.extend(INDEX.pack(index) for index in order)
+
+    chunks.extend(data)
+
+    return b''.join(chunks)
+
+
+class MappedCatalog(object):
+    """
+    Read only view of a mapped catalog file.
+
+    :raises ValueError: The file is empty or not a mapped catalog of this
+        format.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < HEADER.size:
+            raise ValueError('{} is truncated'.format(path))
+
+        (magic, version, self.schema_version, self.count, self.fetched_at,
+         scope, self.entries_offset, self.ids_offset, self.prefixes_offset,
+         self.suffixes_offset) = HEADER.unpack_from(self.map, 0)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('{} is not a mapped catalog'.format(path))
+
+        self.scope = scope.rstrip(b'\0').decode('ascii') or None
+
+    def close(self):
+        self.map.close()
+
+    def get_entry(self, index):
+        return ENTRY.unpack_from(
+            self.map,
+            self.entries_offset + ENTRY.size * index
+        )
+
+    def get_label(self, index):
+        _, _, offset, length = self.get_entry(index)
+
+        return self.map[offset:offset + length].decode('utf-8')
+
+    def get_record(self, index):
+        """
+        Returns the decoded record `index`.
+        """
+        offset, length, _, _ = self.get_entry(index)
+
+        return codec.loads(self.map[offset:offset + length])
+
+    def get_order(self, offset, position):
+        return INDEX.unpack_from(self.map, offset + INDEX.size * position)[0]
+
+    def find_id(self, id):
+        """
+        Returns the index of the first record with `id`, or `None`.
+        """
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            value, index = ID.unpack_from(
+                self.map,
+                self.ids_offset + ID.size * middle
+            )
+
+            if value < id:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count:
+            value, index = ID.unpack_from(
+                self.map,
+                self.ids_offset + ID.size * low
+            )
+
+            if value == id:
+                return index
+
+        return None
+
+    def find_affix(self, offset, query, reverse=False):
+        """
+        Returns the index of the first record (in catalog order) whose
+        label starts (or with `reverse`, ends) with `query`, or `None`.
+        """
+        def get_key(position):
+            label = self.get_label(self.get_order(offset, position))
+
+            return label[::-1] if reverse else label
+
+        if reverse:
+            query = query[::-1]
+
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if get_key(middle) < query:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = None
+
+        for position in range(low, self.count):
+            if not get_key(position).startswith(query):
+                break
+
+            index = self.get_order(offset, position)
+
+            if found is None or index < found:
+                found = index
+
+        return found
+
+    def find_label(self, query, label_match):
+        """
+        Returns the index of the first record whose label matches the
+        lowercased `query` the way `base.Catalog.find` does, or `None`.
+        """
+        if label_match == 'prefix':
+            return self.find_affix(self.prefixes_offset, query)
+
+        plain = not base._REGEX_CHARS.intersection(query)
+
+        if plain and label_match == 'suffix':
+            return self.find_affix(self.suffixes_offset, query, reverse=True)
+
+        search = None
+
+        if not plain:
+            pattern = query + '$' if label_match == 'suffix' else query
+            search = re.compile(pattern).search
+
+        for index in range(self.count):
+            label = self.get_label(index)
+
+            if search(label) if search else query in label:
+                return index
+
+        return None
@@ -1,9 +1,12 @@
 import re
 
-from . import base, cache
+from . import base, cache, compat
 
 
 class Plan(base.BaseObject):
+    label_attr = 'label'
+    label_match = 'suffix'
+
     def __init__(self, api_key, id, label, disk_size):
         super(Plan, self).__init__(api_key, id)
 
@@ -23,10 +26,10 @@ class Plan(base.BaseObject):
         return self.label
 
     def __eq__(self, value):
-        if isinstance(value, basestring):
+        if isinstance(value, compat.string_types):
             return bool(re.search(value.lower() + '$', self.label.lower()))
 
-        if isinstance(value, (int, long)):
+        if isinstance(value, compat.integer_types):
             return value == self.id
 
         return False
@@ -41,19 +44,8 @@ class Plan(base.BaseObject):
 
 
 def load_plans(api_key):
-    try:
-        result = cache.read_from_cache('plans')
-    except:
-        result = base.make_single_call(
-            api_key,
-            'avail.linodeplans'
-        )
-
-        cache.write_to_cache('plans', result)
-
-    for data in result:
-        yield Plan.from_json(api_key, data)
+    return cache.load_catalog(api_key, 'plans', Plan.from_json)
 
 
 def get_plan(api_key, label):
-    return base.filter(load_plans(api_key), label)
+    return cache.lookup(api_key, 'plans', Plan, label)
@@ -0,0 +1,401 @@
+"""
+Shared, adaptive job poller.
+
+Instead of every waiting thread polling `linode.job.list` for its own jobs,
+`Job.wait`, `job.waitall` and `job.waitany` (and their `linode.aio`
+versions) register the jobs they wait for with a single poller thread. Due
+jobs of an api key, across all linodes, are checked with one (chunked)
+batch request and the future of each finished job is completed::
+
+    from linode import poller
+
+    future = poller.watch(api_key, linode_id, job_id)
+    finished_job = future.result()
+
+Polls are scheduled from the durations of the jobs seen so far (see
+`job.get_estimates`): the first poll of a job happens when it is expected
+to finish, later ones back off from `backoff_start` to `backoff_max` times
+`job.POLL_INTERVAL`. Jobs of actions with no estimate yet are polled every
+`job.POLL_INTERVAL` seconds. Polls that can not reach the API are retried
+with the same backoff, only errors about a job fail its future.
+"""
+from concurrent.futures import Future
+import atexit
+import threading
+import time
+
+from . import base, errors, job as linode_job
+
+
+# delay of the first poll after a job was expected to finish, doubled
+# (`backoff_factor`) up to `backoff_max`, all as multiples of
+# `job.POLL_INTERVAL`
+backoff_start = 0.25
+backoff_factor = 2
+backoff_max = 4
+
+
+# linodes with this many due jobs are polled with one `pendingOnly` call
+pending_threshold = 2
+
+
+def get_job_call(key):
+    _, linode_id, job_id = key
+
+    return ('linode.job.list', {'LinodeID': linode_id, 'JobID': job_id})
+
+
+class Watch(object):
+    """
+    A job being polled for.
+    """
+
+    def __init__(self, action, now):
+        self.futures = []
+        self.action = action
+        self.started = now
+        self.next_poll = now
+        # polls made since the job was expected to finish
+        self.late_polls = 0
+        # polls in a row that could not reach the API
+        self.failed_polls = 0
+
+    def schedule(self, now):
+        """
+        Set the time of the next poll, after one made at `now`.
+        """
+        self.failed_polls = 0
+
+        estimate = None
+
+        if self.action:
+            estimate = linode_job.get_estimate(self.action)
+
+        if estimate is None:
+            self.next_poll = now + linode_job.POLL_INTERVAL
+
+            return
+
+        expected = self.started + estimate
+
+        if expected > now:
+            self.next_poll = expected
+
+            return
+
+        delay = min(
+            backoff_start * backoff_factor ** self.late_polls,
+            backoff_max
+        )
+
+        self.next_poll = now + delay * linode_job.POLL_INTERVAL
+        self.late_polls += 1
+
+    def back_off(self, now):
+        """
+        Set the time of the next poll, after one at `now` that could not
+        reach the API.
+        """
+        delay = min(
+            backoff_start * backoff_factor ** self.failed_polls,
+            backoff_max
+        )
+
+        self.next_poll = now + delay * linode_job.POLL_INTERVAL
+        self.failed_polls += 1
+
+
+class Poller(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # (api_key, linode_id, job_id) -> Watch
+        self.watches = {}
+        self.thread = None
+
+    def watch(self, api_key, linode_id, job_id, action=None):
+        """
+        Returns a `concurrent.futures.Future` resolved with the `Job` once
+        it has finished, or with the error raised while polling for it.
+
+        :param action: The job action, if known, to schedule the first poll
+            from its expected duration.
+        """
+        key = (
+            api_key,
+            int(linode_id),
+            linode_job.convert_to_job_id(job_id)
+        )
+
+        future = Future()
+        # a running future can not be cancelled, so cancelling e.g. the
+        # asyncio future wrapping it does not touch the poller
+        future.set_running_or_notify_cancel()
+        future.job_key = key
+
+        with self.lock:
+            watch = self.watches.get(key)
+
+            if watch is None:
+                now = time.time()
+                watch = self.watches[key] = Watch(action, now)
+
+                if action and linode_job.get_estimate(action) is not None:
+                    watch.schedule(now)
+
+                self.wakeup.notify()
+
+            watch.futures.append(future)
+
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run,
+                    name='lipy-job-poller'
+                )
+                self.thread.daemon = True
+                self.thread.start()
+
+        return future
+
+    def unwatch(self, future):
+        """
+        Stop polling for the job of `future` (unless someone else is still
+        waiting for it).
+        """
+        with self.lock:
+            watch = self.watches.get(future.job_key)
+
+            if watch is None:
+                return
+
+            if future in watch.futures:
+                watch.futures.remove(future)
+
+            if not watch.futures:
+                del self.watches[future.job_key]
+
+    def stop(self, timeout=1):
+        """
+        Forget every watched job, failing its waiters with `RuntimeError`, and
+        wait (up to `timeout` seconds) for the thread to exit.
+        """
+        with self.lock:
+            watches = list(self.watches.values())
+            self.watches.clear()
+            self.wakeup.notify()
+
+            thread = self.thread
+
+        for watch in watches:
+            for future in watch.futures:
+                future.set_exception(RuntimeError('Poller stopped'))
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def get_due(self):
+        """
+        Wait until a job is due, and return the keys of the jobs due now or
+        within half a `job.POLL_INTERVAL` (so they share the batch). Returns
+        `None` once nothing is watched.
+        """
+        with self.lock:
+            while True:
+                if not self.watches:
+                    self.thread = None
+
+                    return None
+
+                now = time.time()
+                first = min(
+                    watch.next_poll for watch in self.watches.values()
+                )
+
+                if first <= now:
+                    break
+
+                self.wakeup.wait(first - now)
+
+            until = now + linode_job.POLL_INTERVAL / 2.0
+
+            return [
+                key
+                for key, watch in self.watches.items()
+                if watch.next_poll <= until
+            ]
+
+    def run(self):
+        try:
+            while True:
+                keys = self.get_due()
+
+                if keys is None:
+                    return
+
+                try:
+                    self.poll(keys)
+                except Exception as exc:
+                    # e.g. a malformed response, fail the jobs rather than
+                    # the thread
+                    for key in keys:
+                        self.complete(key, error=exc)
+        finally:
+            with self.lock:
+                # unless `get_due` let a new thread start already
+                if self.thread is threading.current_thread():
+                    self.thread = None
+
+    def poll(self, keys):
+        """
+        Check the jobs `keys`, with at most two batch calls per api key.
+
+        A linode with `pending_threshold` or more due jobs is checked with
+        one `pendingOnly` listing of its jobs. Only the jobs missing from it
+        (finished, or unknown) are then fetched one by one.
+        """
+        by_api_key = {}
+
+        for key in keys:
+            by_linode = by_api_key.setdefault(key[0], {})
+            by_linode.setdefault(key[1], []).append(key)
+
+        for api_key, by_linode in by_api_key.items():
+            calls = []
+            targets = []
+            left = []
+
+            for linode_id, keys in by_linode.items():
+                if len(keys) >= pending_threshold:
+                    calls.append(('linode.job.list', {
+                        'LinodeID': linode_id,
+                        'pendingOnly': 1
+                    }))
+                    targets.append(keys)
+                else:
+                    calls.extend(get_job_call(key) for key in keys)
+                    targets.extend(keys)
+
+            for target, result in self.send(api_key, calls, targets):
+                if isinstance(target, tuple):
+                    self.update(target, result)
+
+                    continue
+
+                if isinstance(result, Exception):
+                    left.extend(target)
+
+                    continue
+
+                pending = dict(
+                    (int(data['JOBID']), data['ACTION']) for data in result
+                )
+
+                for key in target:
+                    if key[2] in pending:
+                        self.reschedule(key, pending[key[2]])
+                    else:
+                        left.append(key)
+
+            if left:
+                calls = [get_job_call(key) for key in left]
+
+                for key, result in self.send(api_key, calls, left):
+                    self.update(key, result)
+
+    def send(self, api_key, calls, targets):
+        """
+        Returns `(target, result)` pairs for the batch of `calls`, with an
+        error for the targets missing from a short response. If the API
+        could not be reached, the jobs of all `targets` are polled again
+        later (backing off). If the batch fails otherwise, they get the
+        error.
+        """
+        try:
+            results = list(base.make_batch_call(api_key, *calls))
+        except Exception as exc:
+            for target in targets:
+                for key in [target] if isinstance(target, tuple) else target:
+                    if isinstance(exc, errors.TransportError):
+                        self.back_off(key)
+                    else:
+                        self.complete(key, error=exc)
+
+            return []
+
+        if len(results) < len(targets):
+            results.extend(
+                [RuntimeError('Missing result in batch response')] *
+                (len(targets) - len(results))
+            )
+
+        return zip(targets, results)
+
+    def update(self, key, result):
+        """
+        Handle the `linode.job.list` `result` for the job `key`.
+        """
+        if isinstance(result, Exception):
+            self.complete(key, error=result)
+
+            return
+
+        job = linode_job.from_results(key[0], [result])[0]
+
+        if job is None:
+            self.complete(key, error=LookupError(
+                'Job {} not found on linode {}'.format(key[2], key[1])
+            ))
+
+            return
+
+        if job.finish:
+            linode_job.record_duration(job.action, job.duration)
+
+            self.complete(key, job)
+
+            return
+
+        self.reschedule(key, job.action)
+
+    def reschedule(self, key, action=None):
+        with self.lock:
+            watch = self.watches.get(key)
+
+            if watch is None:
+                return
+
+            if action and not watch.action:
+                watch.action = action
+
+            watch.schedule(time.time())
+
+    def back_off(self, key):
+        with self.lock:
+            watch = self.watches.get(key)
+
+            if watch is not None:
+                watch.back_off(time.time())
+
+    def complete(self, key, job=None, error=None):
+        with self.lock:
+            watch = self.watches.pop(key, None)
+
+        for future in watch.futures if watch else []:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(job)
+
+
+default_poller = Poller()
+
+# let the thread exit before the interpreter tears the modules down
+atexit.register(default_poller.stop)
+
+
+def watch(api_key, linode_id, job_id, action=None):
+    return default_poller.watch(api_key, linode_id, job_id, action)
+
+
+def unwatch(future):
+    default_poller.unwatch(future)
@@ -0,0 +1,390 @@
+"""
+Opt-in pool of pre-built linodes.
+
+Building the disk of a new linode from a distribution takes minutes. A
+`WarmPool` keeps `size` linodes per (datacenter, plan, distribution) built
+but powered off, and `provision` (or `provision_many`) boots one of them
+instead of building a new linode when its arguments match::
+
+    from linode import pool
+
+    warm_pool = pool.enable(api_key, root_password, size=2)
+    warm_pool.add('london', 'ubuntu', plan='1024')
+
+    linode.provision(api_key, root_password, 'london', 'ubuntu')
+
+Linodes handed out are replaced in the background, by cloning a ready linode
+of the same kind (at most `clones_per_source` clones of one source at a
+time, the API allows 5) or, without one, by building a new one. Failed
+refills are retried with a growing delay.
+
+Pooled linodes are billed like any other. `disable` deletes the idle ones,
+and is called at interpreter exit, which waits for the linodes still being
+built and deletes them too. A process that is killed leaves its pooled
+linodes running.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import threading
+
+from . import base, compat, job as linode_job, linode, retry
+from .provision import build, resolve
+
+
+class Spec(object):
+    """
+    The catalog objects of one kind of pooled linode.
+    """
+
+    def __init__(self, datacenter, plan, distribution, kernel, size):
+        self.datacenter = datacenter
+        self.plan = plan
+        self.distribution = distribution
+        self.kernel = kernel
+        self.size = size
+
+
+class WarmPool(object):
+    """
+    :param api_key: Linode API Key.
+    :param root_password: The root password of the pooled linodes, only
+        requests with the same password are given one.
+    :param size: Default number of linodes kept ready per kind.
+    :param clones_per_source: Most clones made from one linode at a time.
+    :param workers: Most linodes built or cloned at the same time.
+    :param retry_delay: Seconds before retrying a failed refill, doubled
+        after every failure in a row.
+    :param max_retry_delay: Upper bound for `retry_delay`.
+
+    The other arguments are those of `provision`, only requests with the
+    same values are given a pooled linode.
+    """
+
+    def __init__(self, api_key, root_password, size=2, kernel=None,
+                 disk_size=None, swap=256, payment_term=1, private_ip=True,
+                 clones_per_source=5, workers=4, retry_delay=10,
+                 max_retry_delay=600):
+        self.api_key = api_key
+        self.root_password = root_password
+        self.size = size
+        self.kernel = kernel
+        self.settings = (disk_size, swap, payment_term, private_ip)
+        self.clones_per_source = clones_per_source
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(workers)
+        self.closed = False
+        # (datacenter id, plan id, distribution id) -> Spec
+        self.specs = {}
+        # key -> list of powered off linodes
+        self.ready = {}
+        # key -> number of linodes being built or cloned
+        self.pending = {}
+        # linode id -> number of clones being made from it
+        self.cloning = {}
+        # key -> number of failed refills in a row
+        self.failures = {}
+        # key -> timer of the next refill after a failure
+        self.retries = {}
+        # the exception of the last failed refill, if any
+        self.last_error = None
+
+    def add(self, datacenter, distribution, plan='1024', size=None):
+        """
+        Keep `size` (default the pool size) linodes of this kind ready, and
+        start building them.
+
+        :returns: The key of the kind.
+        """
+        datacenter, plan, distribution, kernel = resolve(
+            self.api_key,
+            datacenter,
+            distribution,
+            plan,
+            self.kernel
+        )
+
+        key = (datacenter.id, plan.id, distribution.id)
+
+        with self.lock:
+            self.specs[key] = Spec(
+                datacenter,
+                plan,
+                distribution,
+                kernel,
+                self.size if size is None else size
+            )
+            self.ready.setdefault(key, [])
+            self.pending.setdefault(key, 0)
+
+        self.refill(key)
+
+        return key
+
+    def take(self, api_key, root_password, datacenter, plan, distribution,
+             kernel, disk_size=None, swap=256, payment_term=1,
+             private_ip=True):
+        """
+        Returns a powered off linode built with these arguments (see
+        `provision.build`) and starts replacing it, or `None` if there is
+        none ready.
+
+        Linodes that are not being cloned are handed out first. The boot of a
+        clone source is only run by the API once its clones are done.
+        """
+        if (api_key != self.api_key or
+                root_password != self.root_password or
+                (disk_size, swap, payment_term, private_ip) != self.settings):
+            return None
+
+        key = (datacenter.id, plan.id, distribution.id)
+
+        with self.lock:
+            spec = self.specs.get(key)
+
+            if self.closed or spec is None or spec.kernel.id != kernel.id:
+                return None
+
+            ready = self.ready[key]
+
+            if not ready:
+                linode_instance = None
+            else:
+                linode_instance = min(
+                    ready,
+                    key=lambda node: self.cloning.get(node.id, 0)
+                )
+                ready.remove(linode_instance)
+
+        self.refill(key)
+
+        return linode_instance
+
+    def refill(self, key):
+        """
+        Start building or cloning the linodes missing from kind `key`.
+        """
+        with self.lock:
+            if self.closed:
+                return
+
+            spec = self.specs[key]
+            missing = spec.size - len(self.ready[key]) - self.pending[key]
+
+            for _ in compat.range(max(0, missing)):
+                self.pending[key] += 1
+                self.executor.submit(self.fill, key)
+
+    def fill(self, key):
+        """
+        Add one linode to kind `key`. Runs in the pool threads.
+        """
+        linode_instance = None
+
+        try:
+            source = self.get_source(key)
+
+            if source is not None:
+                linode_instance = self.clone(key, source)
+            else:
+                linode_instance = self.build(key)
+        except Exception as exc:
+            self.last_error = exc
+
+        with self.lock:
+            self.pending[key] -= 1
+
+            if linode_instance is None:
+                self.schedule_retry(key)
+            elif not self.closed:
+                self.failures.pop(key, None)
+                self.ready[key].append(linode_instance)
+
+                return
+
+        if linode_instance is not None:
+            linode.delete_linode(self.api_key, linode_instance.id, True)
+
+    def schedule_retry(self, key):
+        """
+        Refill kind `key` again after a failure, later with every failure in
+        a row. Called with the lock held.
+        """
+        failures = self.failures[key] = self.failures.get(key, 0) + 1
+
+        if self.closed or key in self.retries:
+            return
+
+        delay = min(
+            self.retry_delay * 2 ** (failures - 1),
+            self.max_retry_delay
+        )
+
+        timer = self.retries[key] = threading.Timer(delay, self.retry, [key])
+        timer.daemon = True
+        timer.start()
+
+    def retry(self, key):
+        with self.lock:
+            self.retries.pop(key, None)
+
+        self.refill(key)
+
+    def get_source(self, key):
+        """
+        Returns a ready linode of kind `key` that can be cloned once more,
+        counting the clone, or `None`.
+        """
+        with self.lock:
+            for source in self.ready[key]:
+                clones = self.cloning.get(source.id, 0)
+
+                if clones < self.clones_per_source:
+                    self.cloning[source.id] = clones + 1
+
+                    return source
+
+        return None
+
+    def build(self, key):
+        spec = self.specs[key]
+        disk_size, swap, payment_term, private_ip = self.settings
+
+        return build(
+            self.api_key,
+            self.root_password,
+            spec.datacenter,
+            spec.plan,
+            spec.distribution,
+            spec.kernel,
+            disk_size,
+            swap,
+            payment_term,
+            private_ip,
+            boot=False
+        )
+
+    def clone(self, key, source):
+        """
+        Clone `source` (its disks and config) to a new linode of kind `key`
+        and wait for the clone to finish. The clone counted by `get_source`
+        is released afterwards.
+        """
+        try:
+            return self.make_clone(key, source)
+        finally:
+            with self.lock:
+                self.cloning[source.id] -= 1
+
+                if not self.cloning[source.id]:
+                    del self.cloning[source.id]
+
+    def make_clone(self, key, source):
+        spec = self.specs[key]
+        _, _, payment_term, private_ip = self.settings
+
+        response = base.make_single_call(
+            self.api_key,
+            'linode.clone',
+            LinodeID=source.id,
+            DatacenterID=spec.datacenter.id,
+            PlanID=spec.plan.id,
+            PaymentTerm=payment_term
+        )
+        linode_id = response['LinodeID']
+
+        try:
+            jobs = [
+                linode_job.Job.from_json(self.api_key, data)
+                for data in base.make_single_call(
+                    self.api_key,
+                    'linode.job.list',
+                    LinodeID=linode_id,
+                    pendingOnly=1
+                )
+            ]
+
+            for clone_job in linode_job.as_completed(jobs):
+                clone_job.result()
+
+            batcher = base.APIBatcher(self.api_key)
+
+            # addresses are not cloned
+            if private_ip:
+                batcher.add('linode.ip.addprivate', LinodeID=linode_id)
+
+            batcher.add('linode.list', LinodeID=linode_id)
+
+            results = list(batcher.execute())
+
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        except:
+            with retry.without_deadline():
+                linode.delete_linode(self.api_key, linode_id, True)
+
+            raise
+
+        linode_instance = linode.Linode.from_json(self.api_key, results[-1][0])
+        linode_instance.plan = spec.plan
+        linode_instance.datacenter = spec.datacenter
+
+        return linode_instance
+
+    def close(self, wait=True):
+        """
+        Stop refilling, and delete the linodes that are ready (and, with
+        `wait`, those still being built).
+        """
+        with self.lock:
+            self.closed = True
+
+            for timer in self.retries.values():
+                timer.cancel()
+
+            self.retries.clear()
+
+        self.executor.shutdown(wait)
+
+        with self.lock:
+            linodes = [
+                linode_instance
+                for ready in self.ready.values()
+                for linode_instance in ready
+            ]
+
+            for ready in self.ready.values():
+                del ready[:]
+
+        for error in linode.delete_linodes(self.api_key, linodes, True):
+            if error is not None:
+                self.last_error = error
+
+
+def enable(api_key, root_password, size=2, **kwargs):
+    """
+    Start handing out linodes from a new `WarmPool` (see its arguments) in
+    `provision`. Add kinds of linodes with `WarmPool.add`.
+    """
+    disable()
+
+    base.warm_pool = WarmPool(api_key, root_password, size, **kwargs)
+
+    return base.warm_pool
+
+
+def disable(wait=True):
+    """
+    Stop using the warm pool, and delete its idle linodes.
+    """
+    warm_pool, base.warm_pool = base.warm_pool, None
+
+    if warm_pool is not None:
+        warm_pool.close(wait)
+
+
+# pooled linodes are billed, do not leave the idle ones behind
+atexit.register(disable)
@@ -1,17 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+
 from . import config as linode_config
 from . import datacenter as linode_datacenter
 from . import disk as linode_disk
 from . import distribution as linode_distribution
-from . import ip as linode_ip
+from . import job as linode_job
 from . import kernel as linode_kernel
 from . import plan as linode_plan
 
-from . import linode
+from . import base, compat, linode, retry
+
+
+log = logging.getLogger(__name__)
 
 
 def provision(api_key, root_password, datacenter, distribution, plan='1024',
               kernel=None, disk_size=None, swap=256, payment_term=1,
-              private_ip=True):
+              private_ip=True, timeout=None):
     """
     Create and boot a linode
 
@@ -31,58 +38,414 @@ def provision(api_key, root_password, datacenter, distribution, plan='1024',
     :param swap: How much swap you want to create.
     :param payment_term: 1 = monthly, 12 = yearly, 24 = biannually
     :param private_ip: Whether to create a LAN IP. Defaults to True
+    :param timeout: Seconds the whole operation may take, including waiting
+        for jobs. Raises `DeadlineExceeded` (and deletes the linode) when it
+        runs out.
+
+    If a warm pool is enabled (see `linode.pool`) and has a pre-built linode
+    matching the arguments, that linode is booted and returned instead.
     """
-    datacenter = linode_datacenter.get_datacenter(api_key, datacenter)
-    plan = linode_plan.get_plan(api_key, plan)
-    distribution = linode_distribution.get_distribution(api_key, distribution)
+    with retry.deadline(timeout):
+        datacenter, plan, distribution, kernel = resolve(
+            api_key,
+            datacenter,
+            distribution,
+            plan,
+            kernel
+        )
 
-    if kernel:
-        kernel = linode_kernel.get_kernel(api_key, kernel)
-    else:
-        kernel = 'Latest '
+        return build(
+            api_key,
+            root_password,
+            datacenter,
+            plan,
+            distribution,
+            kernel,
+            disk_size,
+            swap,
+            payment_term,
+            private_ip
+        )
 
-        if distribution.x64:
-            kernel += '64 bit'
-        else:
-            kernel += '32 bit'
 
-        kernel = linode_kernel.get_kernel(api_key, kernel)
+def provision_many(api_key, count, root_password, datacenter, distribution,
+                   plan='1024', kernel=None, disk_size=None, swap=256,
+                   payment_term=1, private_ip=True, timeout=None,
+                   workers=10, progress=None):
+    """
+    Create and boot `count` linodes concurrently.
+
+    The catalogs are resolved once, then up to `workers` linodes are built
+    at the same time. Creates wait for the client side `linode.create` rate
+    limit (see `linode.ratelimit`), and the disk and boot jobs of all nodes
+    are polled together (see `linode.poller`). A node that fails is deleted
+    without affecting the others.
+
+    Takes the same arguments as `provision`, plus:
+
+    :param count: Number of linodes to create.
+    :param timeout: Seconds the whole fleet may take.
+    :param workers: Most linodes built at the same time.
+    :param progress: Called as `progress(index, step, value)` as node
+        `index` (0 to `count - 1`) goes through the steps: `'created'`,
+        `'private_ip'`, `'disks'`, `'config'` and `'booted'` with the linode,
+        then `'done'` with the linode or `'failed'` with the exception.
+        Linodes from the warm pool (see `linode.pool`) only go through
+        `'booted'`. Called from the worker threads. Errors raised by it are
+        logged and otherwise ignored.
+    :returns: A list with, for each node, the linode or the exception that
+        made it fail.
+    """
+    with retry.deadline(timeout):
+        datacenter, plan, distribution, kernel = resolve(
+            api_key,
+            datacenter,
+            distribution,
+            plan,
+            kernel
+        )
+
+        def build_node(index):
+            report = None
+
+            if progress:
+                report = functools.partial(notify, progress, index)
+
+            try:
+                linode_instance = build(
+                    api_key,
+                    root_password,
+                    datacenter,
+                    plan,
+                    distribution,
+                    kernel,
+                    disk_size,
+                    swap,
+                    payment_term,
+                    private_ip,
+                    report
+                )
+            except Exception as exc:
+                if report:
+                    report('failed', exc)
+
+                return exc
+
+            if report:
+                report('done', linode_instance)
+
+            return linode_instance
+
+        when = retry.get_deadline()
 
-    linode_instance = linode.create_linode(
+        with ThreadPoolExecutor(max(1, min(workers, count))) as executor:
+            futures = [
+                executor.submit(
+                    base.call_with_deadline,
+                    when,
+                    build_node,
+                    index
+                )
+                for index in compat.range(count)
+            ]
+
+            return [future.result() for future in futures]
+
+
+def build(api_key, root_password, datacenter, plan, distribution, kernel,
+          disk_size=None, swap=256, payment_term=1, private_ip=True,
+          progress=None, boot=True):
+    """
+    Create and boot a linode from the catalog objects returned by `resolve`.
+    The linode is deleted again if any step fails.
+
+    Calls that do not depend on each other are sent together, so a node
+    takes four requests besides the job polls: `linode.create`, a batch
+    creating the disks and private IP (and loading the linode) and, once the
+    disks are built, `linode.config.create` then `linode.boot`.
+
+    A matching linode from the warm pool (see `linode.pool`), if enabled, is
+    booted instead.
+
+    :param progress: Called as `progress(step, linode)` after each step, see
+        `provision_many`.
+    :param boot: Whether to boot the linode. If `False` it is left powered
+        off, without the `'booted'` step.
+    """
+    def report(step):
+        if progress:
+            notify(progress, step, linode_instance)
+
+    if boot and base.warm_pool is not None:
+        linode_instance = base.warm_pool.take(
+            api_key,
+            root_password,
+            datacenter,
+            plan,
+            distribution,
+            kernel,
+            disk_size,
+            swap,
+            payment_term,
+            private_ip
+        )
+
+        if linode_instance is not None:
+            try:
+                boot_linode(api_key, linode_instance.id).wait()
+            except:
+                with retry.without_deadline():
+                    linode.delete_linode(api_key, linode_instance.id, True)
+
+                raise
+
+            report('booted')
+
+            return linode_instance
+
+    response = base.make_single_call(
         api_key,
-        datacenter.id,
-        plan.id,
-        payment_term
+        'linode.create',
+        DatacenterID=datacenter.id,
+        PlanID=plan.id,
+        PaymentTerm=payment_term
     )
+    linode_id = response['LinodeID']
 
     try:
-        create_disk(
+        linode_instance, disk_jobs = create_resources(
             api_key,
-            linode_instance,
+            linode_id,
+            plan,
             distribution,
             root_password,
             disk_size,
-            swap
+            swap,
+            private_ip
         )
-        create_config(
+        linode_instance.plan = plan
+        linode_instance.datacenter = datacenter
+
+        report('created')
+
+        if private_ip:
+            report('private_ip')
+
+        for disk_job in linode_job.as_completed(disk_jobs):
+            disk_job.result()
+
+        report('disks')
+
+        boot_job = configure(
             api_key,
-            linode_instance,
+            linode_id,
             distribution,
-            kernel
+            kernel,
+            [disk_job.disk_id for disk_job in disk_jobs],
+            boot
         )
+        report('config')
 
-        if private_ip:
-            linode_ip.add_private(api_key, linode_instance.id)
-
-        linode_instance.boot()
+        if boot_job:
+            boot_job.wait()
+            report('booted')
     except:
-        linode_instance.delete(True)
+        # clean up even if the deadline has passed
+        with retry.without_deadline():
+            linode.delete_linode(api_key, linode_id, True)
 
         raise
 
     return linode_instance
 
 
+def notify(progress, *args):
+    """
+    Call the `progress` callback with `args`. Its errors are logged, they
+    never make provisioning fail.
+    """
+    try:
+        progress(*args)
+    except Exception:
+        log.exception('Error in progress callback %r', progress)
+
+
+def check_results(results):
+    """
+    Returns the batch `results` as a list, raising the first failed call.
+    """
+    results = list(results)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+    return results
+
+
+def create_resources(api_key, linode_id, plan, distribution, root_password,
+                     disk_size=None, swap=256, private_ip=True):
+    """
+    Create the disks (and private IP) of a new linode with one batch call.
+
+    :returns: A `(linode, disk_jobs)` tuple, see `read_resources`.
+    """
+    calls = get_resource_calls(
+        linode_id,
+        plan,
+        distribution,
+        root_password,
+        disk_size,
+        swap,
+        private_ip
+    )
+
+    return read_resources(
+        api_key,
+        linode_id,
+        calls,
+        base.make_batch_call(api_key, *calls)
+    )
+
+
+def get_resource_calls(linode_id, plan, distribution, root_password,
+                       disk_size=None, swap=256, private_ip=True):
+    """
+    Returns the `(action, kwargs)` calls creating the disks (and private
+    IP) of a new linode, and loading it.
+    """
+    calls = [(
+        'linode.disk.createfromdistribution', {
+            'LinodeID': linode_id,
+            'DistributionID': distribution.id,
+            'Label': '{} Disk Image'.format(distribution.label),
+            'Size': disk_size or plan.disk_size - swap,
+            'rootPass': root_password
+        }
+    )]
+
+    if swap:
+        calls.append((
+            'linode.disk.create', {
+                'LinodeID': linode_id,
+                'Label': '{}MB Swap Image'.format(swap),
+                'Type': 'swap',
+                'Size': swap
+            }
+        ))
+
+    if private_ip:
+        calls.append(('linode.ip.addprivate', {'LinodeID': linode_id}))
+
+    calls.append(('linode.list', {'LinodeID': linode_id}))
+
+    return calls
+
+
+def read_resources(api_key, linode_id, calls, results):
+    """
+    Read the batch `results` of the `get_resource_calls` `calls`.
+
+    :returns: A `(linode, disk_jobs)` tuple. The unfinished disk jobs, main
+        disk first, have a `disk_id` attribute.
+    """
+    results = check_results(results)
+    disk_jobs = []
+
+    for (action, _), response in zip(calls, results):
+        if not action.startswith('linode.disk.'):
+            continue
+
+        # the jobs are named without the prefix, e.g. `disk.create`
+        disk_job = linode_job.from_response(
+            api_key,
+            linode_id,
+            response,
+            action[len('linode.'):]
+        )
+        disk_job.disk_id = response['DiskID']
+
+        disk_jobs.append(disk_job)
+
+    return linode.Linode.from_json(api_key, results[-1][0]), disk_jobs
+
+
+def configure(api_key, linode_id, distribution, kernel, disk_ids, boot=True):
+    """
+    Create the config profile of a linode with built disks `disk_ids` and,
+    with `boot`, boot it (from that only profile) once the config exists.
+
+    :returns: The unfinished boot `Job`, or `None` without `boot`.
+    """
+    base.make_single_call(
+        api_key,
+        'linode.config.create',
+        **get_config_request(linode_id, distribution, kernel, disk_ids)
+    )
+
+    if not boot:
+        return None
+
+    return boot_linode(api_key, linode_id)
+
+
+def get_config_request(linode_id, distribution, kernel, disk_ids):
+    """
+    Returns the `linode.config.create` arguments of `configure`.
+    """
+    request = linode_config._dict_to_request({'disk_list': disk_ids})
+    request.update({
+        'LinodeID': linode_id,
+        'KernelID': kernel.id,
+        'Label': 'My {} Profile'.format(distribution.label)
+    })
+
+    return request
+
+
+def boot_linode(api_key, linode_id):
+    """
+    Boot a linode, without looking the job up first.
+
+    :returns: The unfinished boot `Job`.
+    """
+    response = base.make_single_call(
+        api_key,
+        'linode.boot',
+        LinodeID=linode_id
+    )
+
+    return linode_job.from_response(
+        api_key,
+        linode_id,
+        response,
+        'linode.boot'
+    )
+
+
+def resolve(api_key, datacenter, distribution, plan, kernel=None):
+    """
+    Look up the catalog objects needed to provision a linode.
+
+    :returns: A `(datacenter, plan, distribution, kernel)` tuple.
+    """
+    datacenter = linode_datacenter.get_datacenter(api_key, datacenter)
+    plan = linode_plan.get_plan(api_key, plan)
+    distribution = linode_distribution.get_distribution(api_key, distribution)
+
+    if not kernel:
+        kernel = 'Latest '
+
+        if distribution.x64:
+            kernel += '64 bit'
+        else:
+            kernel += '32 bit'
+
+    kernel = linode_kernel.get_kernel(api_key, kernel)
+
+    return datacenter, plan, distribution, kernel
+
+
 def create_disk(api_key, linode_obj, distribution, root_password, size=None,
                 swap=256, block=True):
     """
@@ -126,13 +489,17 @@ def create_disk(api_key, linode_obj, distribution, root_password, size=None,
     if not block:
         return jobs
 
-    for job in jobs:
-        job.wait()
+    for job in linode_job.as_completed(jobs):
+        job.result()
 
 
 def create_config(api_key, linode_obj, distribution, kernel, **extra):
     if 'disk_list' not in extra:
-        extra['disk_list'] = linode_obj.disks
+        # not `linode_obj.disks`, which may be a prefetched snapshot from
+        # before the disks were created
+        extra['disk_list'] = list(
+            linode_disk.get_by_linode(api_key, linode_obj.id)
+        )
 
     return linode_config.create_config(
         api_key,
@@ -0,0 +1,216 @@
+"""
+Client side rate limiting of Linode API calls.
+
+Limits are token buckets keyed per api key and action, optionally scoped by
+one of the call arguments (e.g. `LinodeID` for clones of one source). Calls
+over the limit queue until a token becomes available rather than failing in
+the API::
+
+    from linode import ratelimit
+
+    ratelimit.set_limit('linode.create', 75, 3600)
+    ratelimit.budget(api_key, 'linode.create')
+
+The special action `'*'` applies to every call made with an api key.
+"""
+import threading
+import time
+
+from . import errors, retry
+
+
+class TokenBucket(object):
+    """
+    Holds up to `capacity` tokens, refilled evenly over `period` seconds.
+    """
+
+    def __init__(self, capacity, period, now=None):
+        self.capacity = capacity
+        self.rate = float(capacity) / period
+        self.tokens = float(capacity)
+        self.updated = now or time.time()
+
+    def refill(self, now):
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def reserve(self, now):
+        """
+        Take a token, returning how many seconds the caller must wait before
+        it may be used. Tokens can go negative so waiting callers are served
+        in the order they reserved.
+        """
+        self.refill(now)
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / self.rate
+
+
+class RateLimiter(object):
+    def __init__(self):
+        self.limits = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def set_limit(self, action, capacity, period, per=None):
+        """
+        Allow `capacity` calls to `action` every `period` seconds.
+
+        :param per: Name of a call argument to keep separate buckets for,
+            e.g. `'LinodeID'`.
+        """
+        with self.lock:
+            self.limits[action] = (capacity, period, per)
+            self.drop_buckets(action)
+
+    def remove_limit(self, action):
+        with self.lock:
+            self.limits.pop(action, None)
+            self.drop_buckets(action)
+
+    def reset(self):
+        """
+        Forget the tokens used so far, refilling every bucket.
+        """
+        with self.lock:
+            self.buckets.clear()
+
+    def drop_buckets(self, action):
+        for key in list(self.buckets):
+            if key[1] == action:
+                del self.buckets[key]
+
+    def get_buckets(self, api_key, action, kwargs, now):
+        for name in ('*', action):
+            try:
+                capacity, period, per = self.limits[name]
+            except KeyError:
+                continue
+
+            scope = None
+
+            if per:
+                scope = str(kwargs.get(per))
+
+            key = (api_key, name, scope)
+
+            try:
+                bucket = self.buckets[key]
+            except KeyError:
+                bucket = self.buckets[key] = TokenBucket(
+                    capacity,
+                    period,
+                    now
+                )
+
+            yield bucket
+
+    def reserve(self, api_key, action, kwargs, max_wait=None):
+        """
+        Reserve the tokens needed for a call, returning the number of
+        seconds to wait before making it. Each sub-call of a `batch` is
+        accounted for separately.
+
+        :param max_wait: Most seconds the caller can wait. If the call would
+            have to wait longer, no token is taken.
+        :raises DeadlineExceeded: The wait would be longer than `max_wait`.
+        """
+        if action == 'batch':
+            calls = [
+                (sub_call.get('api_action'), sub_call)
+                for sub_call in kwargs.get('api_requestArray', [])
+            ]
+        else:
+            calls = [(action, kwargs)]
+
+        wait = 0
+
+        with self.lock:
+            if not self.limits:
+                return 0
+
+            now = time.time()
+            taken = []
+
+            for action, kwargs in calls:
+                for bucket in self.get_buckets(api_key, action, kwargs, now):
+                    wait = max(wait, bucket.reserve(now))
+                    taken.append(bucket)
+
+            if max_wait is not None and wait > max_wait:
+                for bucket in taken:
+                    bucket.tokens += 1
+
+                raise errors.DeadlineExceeded('Deadline exceeded')
+
+        return wait
+
+    def acquire(self, api_key, action, kwargs):
+        """
+        Block until the call is allowed to be made. Raises
+        `DeadlineExceeded` straight away, without taking a token, if that
+        would be after the current deadline.
+        """
+        wait = self.reserve(api_key, action, kwargs, retry.time_left())
+
+        if wait:
+            retry.sleep(wait)
+
+    def budget(self, api_key, action, **kwargs):
+        """
+        Returns the number of calls to `action` that can be made right now
+        without waiting, or `None` if the action is not limited.
+        """
+        budget = None
+
+        with self.lock:
+            now = time.time()
+
+            for bucket in self.get_buckets(api_key, action, kwargs, now):
+                bucket.refill(now)
+
+                tokens = max(0, int(bucket.tokens))
+
+                if budget is None or tokens < budget:
+                    budget = tokens
+
+        return budget
+
+
+default_limiter = RateLimiter()
+
+# documented Linode API limits
+default_limiter.set_limit('linode.create', 75, 3600)
+# the API allows 5 active clones per source linode. Clones usually finish
+# well within 10 minutes.
+default_limiter.set_limit('linode.clone', 5, 600, per='LinodeID')
+
+
+def set_limit(action, capacity, period, per=None):
+    default_limiter.set_limit(action, capacity, period, per)
+
+
+def remove_limit(action):
+    default_limiter.remove_limit(action)
+
+
+def reserve(api_key, action, kwargs, max_wait=None):
+    return default_limiter.reserve(api_key, action, kwargs, max_wait)
+
+
+def acquire(api_key, action, kwargs):
+    default_limiter.acquire(api_key, action, kwargs)
+
+
+def budget(api_key, action, **kwargs):
+    return default_limiter.budget(api_key, action, **kwargs)
+
+
+def reset():
+    default_limiter.reset()
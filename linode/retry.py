@@ -0,0 +1,268 @@
+"""
+Retries, hedged requests and deadlines for API calls.
+
+Only read-only actions (`*.list` and `avail.*`, or batches made up of them)
+are retried automatically, since repeating a write could e.g. create two
+linodes. Deadlines bound everything done by the current thread::
+
+    from linode import retry
+
+    with retry.deadline(600):
+        linode.provision(...)
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import contextlib
+import random
+import threading
+import time
+
+from . import errors
+
+
+# status codes worth retrying a read for
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+def is_read_only(action, kwargs=None):
+    if action == 'batch':
+        sub_calls = (kwargs or {}).get('api_requestArray') or []
+
+        return bool(sub_calls) and all(
+            is_read_only(sub_call.get('api_action', ''))
+            for sub_call in sub_calls
+        )
+
+    return action.endswith('.list') or action.startswith('avail.')
+
+
+class RetryPolicy(object):
+    """
+    :param attempts: Most attempts made for a read-only call.
+    :param backoff: Base delay in seconds, doubled after every attempt.
+    :param max_backoff: Upper bound for the delay between attempts.
+    :param hedge_after: If set, send a second copy of a read-only request
+        when the first has not answered after this many seconds, and use
+        whichever response arrives first.
+    """
+
+    def __init__(self, attempts=4, backoff=0.25, max_backoff=8,
+                 hedge_after=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+
+    def delays(self):
+        """
+        Yields jittered exponential backoff delays ("full jitter").
+        """
+        attempt = 0
+
+        while True:
+            cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+
+            yield random.uniform(0, cap)
+
+            attempt += 1
+
+    def is_retryable(self, exc):
+        if isinstance(exc, errors.DeadlineExceeded):
+            return False
+
+        if exc.status_code is None:
+            return True
+
+        return exc.status_code in RETRY_STATUS_CODES
+
+    def call(self, action, kwargs, send):
+        """
+        Call `send(time_left)` following this policy. `time_left` is the
+        number of seconds until the current deadline, or `None`. Hedge
+        copies are sent as `send(time_left, hedged=True)`.
+        """
+        read_only = is_read_only(action, kwargs)
+        attempts = self.attempts if read_only else 1
+        delays = self.delays()
+
+        for attempt in range(attempts):
+            left = check_deadline()
+
+            try:
+                if read_only and self.hedge_after is not None:
+                    return self.hedge(send, left)
+
+                return send(left)
+            except errors.TransportError as exc:
+                if attempt + 1 >= attempts or not self.is_retryable(exc):
+                    raise
+
+            sleep(next(delays))
+
+    def hedge(self, send, left):
+        executor = get_executor()
+        futures = [executor.submit(send, left)]
+
+        done, _ = wait(futures, timeout=self.hedge_after)
+
+        if not done:
+            futures.append(executor.submit(send, time_left(), hedged=True))
+
+        error = None
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                futures.remove(future)
+
+                try:
+                    return future.result()
+                except errors.TransportError as exc:
+                    error = exc
+
+        raise error
+
+
+default_policy = RetryPolicy()
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_policy():
+    return default_policy
+
+
+def set_policy(policy):
+    global default_policy
+
+    default_policy = policy
+
+
+def get_executor():
+    """
+    Returns the thread pool hedged requests are sent from.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(8)
+
+    return _executor
+
+
+def call(action, kwargs, send):
+    return default_policy.call(action, kwargs, send)
+
+
+def get_deadline():
+    """
+    Returns the absolute deadline (as `time.time()`) for the current thread
+    or `None`.
+    """
+    stack = getattr(_local, 'stack', None)
+
+    if not stack:
+        return None
+
+    return stack[-1]
+
+
+@contextlib.contextmanager
+def deadline_at(when):
+    """
+    Bound everything done by the current thread to finish before `when`.
+    Nested deadlines can only shorten the outer one.
+    """
+    current = get_deadline()
+
+    if current is not None and (when is None or current < when):
+        when = current
+
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(when)
+
+    try:
+        yield when
+    finally:
+        stack.pop()
+
+
+def deadline(seconds):
+    """
+    Bound everything done by the current thread to finish within `seconds`.
+    `None` leaves the current deadline (if any) in place.
+    """
+    if seconds is None:
+        return deadline_at(None)
+
+    return deadline_at(time.time() + seconds)
+
+
+@contextlib.contextmanager
+def without_deadline():
+    """
+    Lift the current deadline, e.g. to clean up after it has passed.
+    """
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(None)
+
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def time_left():
+    when = get_deadline()
+
+    if when is None:
+        return None
+
+    return when - time.time()
+
+
+def check_deadline():
+    """
+    Raise `DeadlineExceeded` if the deadline has passed, otherwise return the
+    seconds left (or `None`).
+    """
+    left = time_left()
+
+    if left is not None and left <= 0:
+        raise errors.DeadlineExceeded('Deadline exceeded')
+
+    return left
+
+
+def sleep(seconds):
+    """
+    `time.sleep` that does not sleep past the current deadline.
+    """
+    left = check_deadline()
+
+    if left is not None:
+        seconds = min(seconds, left)
+
+    time.sleep(seconds)
+
+
+def bound_timeout(timeout, left):
+    """
+    Shorten a requests `timeout` (a number or `(connect, read)` tuple) so a
+    request can not outlive the `left` seconds until the deadline.
+    """
+    if left is None:
+        return timeout
+
+    left = max(left, 0.001)
+
+    if timeout is None:
+        return left
+
+    if isinstance(timeout, tuple):
+        return tuple(min(value, left) for value in timeout)
+
+    return min(timeout, left)
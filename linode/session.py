@@ -0,0 +1,169 @@
+"""
+Pooled keep-alive HTTP sessions for talking to the Linode API.
+
+`requests.Session` is not safe to share between threads, so one session is
+kept per (thread, api key) pair. Each session holds its own connection pool
+so repeated calls reuse the same TCP/TLS connection to api.linode.com. The
+sessions of threads that have exited are closed as new ones are created.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool(object):
+    """
+    Hands out keep-alive `requests.Session` objects keyed per api key and
+    thread.
+
+    :param pool_size: Maximum number of connections kept open per session.
+    :param keep_alive: Whether to reuse connections between calls.
+    :param timeout: Default `(connect, read)` timeout in seconds applied to
+        every request made through the pool.
+    :param max_retries: Connection level retries handed to the urllib3
+        adapter.
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, timeout=(5, 60),
+                 max_retries=0):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.mounts = {}
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (thread, session) pairs
+        self._sessions = []
+
+    def configure(self, **kwargs):
+        """
+        Change the pool settings. Sessions created with the old settings are
+        closed and replaced the next time they are requested.
+        """
+        for name, value in kwargs.items():
+            if not hasattr(self, name) or name.startswith('_'):
+                raise TypeError('Unknown session option {!r}'.format(name))
+
+            setattr(self, name, value)
+
+        self.close()
+
+    def mount(self, prefix, adapter):
+        """
+        Mount a transport adapter on every session handed out by this pool.
+        Useful for pointing the library at a local fake of the API.
+        """
+        self.mounts[prefix] = adapter
+
+        self.close()
+
+    def unmount(self, prefix):
+        self.mounts.pop(prefix, None)
+
+        self.close()
+
+    def get(self, api_key):
+        """
+        Returns the session for `api_key` belonging to the current thread.
+        """
+        sessions = getattr(self._local, 'sessions', None)
+
+        if sessions is None or self._local.generation != self._generation:
+            sessions = self._local.sessions = {}
+            self._local.generation = self._generation
+
+        try:
+            return sessions[api_key]
+        except KeyError:
+            pass
+
+        session = sessions[api_key] = self.create_session()
+
+        with self._lock:
+            # close the sessions of threads that have exited, as threads
+            # come and go (executors, the job poller ...)
+            alive = []
+            dead = []
+
+            for entry in self._sessions:
+                if entry[0].is_alive():
+                    alive.append(entry)
+                else:
+                    dead.append(entry[1])
+
+            alive.append((threading.current_thread(), session))
+            self._sessions = alive
+
+        for old_session in dead:
+            old_session.close()
+
+        return session
+
+    def create_session(self):
+        session = requests.Session()
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=self.max_retries
+        )
+
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        for prefix, mounted in self.mounts.items():
+            session.mount(prefix, mounted)
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def request(self, api_key, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        return self.get(api_key).request(method, url, **kwargs)
+
+    def post(self, api_key, url, **kwargs):
+        return self.request(api_key, 'POST', url, **kwargs)
+
+    def close(self):
+        """
+        Close every session handed out so far. Threads will transparently
+        pick up fresh sessions on their next call.
+        """
+        with self._lock:
+            self._generation += 1
+            sessions, self._sessions = self._sessions, []
+
+        for _, session in sessions:
+            session.close()
+
+
+default_pool = SessionPool()
+
+
+def get_session(api_key):
+    return default_pool.get(api_key)
+
+
+def configure(**kwargs):
+    """
+    Configure the shared session pool, e.g.::
+
+        session.configure(pool_size=20, timeout=(3, 30))
+    """
+    default_pool.configure(**kwargs)
+
+
+def post(api_key, url, **kwargs):
+    return default_pool.post(api_key, url, **kwargs)
+
+
+def close():
+    default_pool.close()
@@ -9,8 +9,16 @@ setup_args = dict(
     maintainer_email='nick@boxdesign.co.uk',
     packages=find_packages('.'),
     install_requires=[
+        'futures; python_version < "3"',
         'requests'
-    ]
+    ],
+    extras_require={
+        'aio': ['aiohttp'],
+        'speedups': [
+            'orjson; python_version >= "3"',
+            'ujson; python_version < "3"'
+        ]
+    }
 )
 
 
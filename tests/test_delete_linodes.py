@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+
+from linode import cache, errors, fake, job, linode
+
+
+class DeleteLinodesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = cache.cache_dir
+        self.poll_interval = job.POLL_INTERVAL
+
+        cache.cache_dir = tempfile.mkdtemp()
+        job.POLL_INTERVAL = 0.01
+
+        self.api = fake.install(job_durations={'linode.shutdown': 0.02})
+        self.linode_ids = self.api.seed(3)
+
+        for linode_id in self.linode_ids:
+            self.api.linodes[linode_id]['STATUS'] = 1
+
+    def tearDown(self):
+        fake.uninstall()
+
+        cache.cache_dir = self.cache_dir
+        job.POLL_INTERVAL = self.poll_interval
+
+    def test_failed_job_poll(self):
+        broken = self.linode_ids[1]
+        job_list = self.api.linode_job_list
+
+        def linode_job_list(params):
+            if self.api.int_param(params, 'LinodeID') == broken:
+                raise fake.FakeAPIError(5, 'Object not found')
+
+            return job_list(params)
+
+        self.api.linode_job_list = linode_job_list
+
+        steps = []
+
+        results = linode.delete_linodes(
+            fake.API_KEY,
+            self.linode_ids,
+            progress=lambda linode_id, step, value: steps.append(
+                (linode_id, step)
+            )
+        )
+
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], errors.APIError)
+        self.assertIsNone(results[2])
+
+        self.assertEqual(list(self.api.linodes), [broken])
+        self.assertIn((broken, 'failed'), steps)
+        self.assertNotIn((broken, 'deleted'), steps)
+
+
+if __name__ == '__main__':
+    unittest.main()